@@ -0,0 +1,203 @@
+"""Бюджет запуска и перезапуска Streamlit-приложения.
+
+    python bench_startup.py            # замер и проверка бюджета (код возврата 1 при превышении)
+    python bench_startup.py --reruns 20
+
+В отдельном чистом процессе приложение запускается через AppTest
+(Google Sheets подменяется тестовыми компаниями, psycopg2.connect —
+соединением-заглушкой с --reports отчётами текущего месяца): холодный
+старт — импорт модулей и первый прогон скрипта с чтением отчёта, журнала
+и трендов, затем --reruns перезапусков. Байты — суммарный размер
+ForwardMsg, которые сервер отправил бы браузеру за прогон. Дополнительно
+проверяется, что клиенты Google Sheets не импортируются, пока данные
+таблицы в кэше, и что приложение не показало ошибок.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_score_app.py")
+
+# Бюджет: при превышении бенчмарк завершается с ошибкой. Замер при 300 компаниях и
+# 50 отчётах в журнале: холодный старт ~2.0 с, перезапуск ~0.7–1.0 с и ~430 КБ.
+# Без отчётов — ~250 мс и ~42 КБ (из них ~20 КБ — списки трёх выборов компании),
+# каждый отчёт журнала (свёрнутый expander с полями правки) добавляет ~8 КБ и ~14 мс
+BUDGET = {
+    "cold_start_s": 3.0,
+    "rerun_p50_ms": 1500,
+    "rerun_bytes": 480_000,
+}
+# Не должны импортироваться, пока данные таблицы в кэше
+LAZY_MODULES = ["gspread", "oauth2client"]
+
+
+class FakeCursor:
+    """Ответы на запросы приложения по тексту SQL (отчёт месяца, журнал, тренды)"""
+
+    def __init__(self, data):
+        self.data = data
+        self.rows = []
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if "to_regclass" in query:
+            self.rows = [(True,)]
+        elif "FROM closed_months" in query:
+            self.rows = []
+        elif "FROM month_results" in query:
+            self.rows = []
+        elif query.startswith("WITH src"):
+            self.rows = self.data["trends"]
+        elif "LIMIT 1" in query:
+            # visits.fetch_month_report: id, facts_json, баллы, visit_dates, planned_visits
+            self.rows = [(r[0], r[4], r[5], r[6], r[7], r[8], r[9]) for r in self.data["journal"][:1]]
+        elif "FROM reports" in query:
+            self.rows = self.data["journal"]
+        else:
+            self.rows = []
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, data):
+        self.data = data
+
+    def cursor(self):
+        return FakeCursor(self.data)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_db_data(companies, reports):
+    """Отчёты текущего месяца по первым reports компаниям и тренды за год"""
+    now = datetime.now()
+    month_year = now.strftime("%Y-%m")
+    journal = []
+    for i in range(reports):
+        facts = [20 + i % 50, 30 + i % 40]
+        dates = [(now - timedelta(days=d)).isoformat() for d in (2, 1)]
+        journal.append((i + 1, now - timedelta(minutes=i), f"Компания {i % companies}", month_year,
+                        json.dumps(facts), 3, 4, 75.0, dates, 4))
+    trends = []
+    for n in range(12):
+        year, month = divmod(now.year * 12 + now.month - 1 - (11 - n), 12)
+        trends.append((f"{year:04d}-{month + 1:02d}", reports, 70.0 + n, 1.0, 70.0 + n, 0.75, 0.01, 25.0))
+    return {"journal": journal, "trends": trends}
+
+
+def child(reruns, companies, reports):
+    """Замер в свежем интерпретаторе; печатает JSON с результатами"""
+    started = time.perf_counter()
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    # Пустая очередь выездов в своём каталоге, а не в рабочем
+    queue_dir = tempfile.TemporaryDirectory(prefix="bench_queue_")
+    os.environ["VISIT_QUEUE_PATH"] = os.path.join(queue_dir.name, "queue.sqlite3")
+    import pandas as pd
+    import psycopg2
+    from streamlit.testing.v1 import AppTest, local_script_runner
+
+    sent = []
+    original_run = local_script_runner.LocalScriptRunner.run
+
+    def run(self, *args, **kwargs):
+        tree = original_run(self, *args, **kwargs)
+        sent.append(sum(msg.ByteSize() for msg in self.forward_msgs()))
+        return tree
+    local_script_runner.LocalScriptRunner.run = run
+
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    import sheets
+    df = pd.DataFrame({"name": [f"Компания {i}" for i in range(companies)], "stations": [100] * companies})
+    df.attrs["snapshot"] = int(pd.util.hash_pandas_object(df["name"], index=False).sum())
+    # Имитация данных таблицы, уже лежащих в кэше
+    sheets.load_companies_from_gsheet = lambda: df.copy()
+    # Настоящий путь чтения (db.get_db_connection → psycopg2.connect), но без сервера
+    data = fake_db_data(companies, reports)
+    psycopg2.connect = lambda *args, **kwargs: FakeConnection(data)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.secrets["postgres"] = {"host": "bench", "port": 5432, "database": "bench", "user": "bench", "password": "bench"}
+    at.run()
+    cold_start = time.perf_counter() - started
+
+    rerun_times = []
+    for _ in range(reruns):
+        t = time.perf_counter()
+        at.run()
+        rerun_times.append(time.perf_counter() - t)
+
+    print(json.dumps({
+        "cold_start_s": cold_start,
+        "first_run_bytes": sent[0],
+        "rerun_p50_ms": statistics.median(rerun_times) * 1e3,
+        "rerun_max_ms": max(rerun_times) * 1e3,
+        "rerun_bytes": statistics.median(sent[1:]) if reruns else 0,
+        "exceptions": [str(e.value) for e in at.exception] + [str(e.value) for e in at.error]
+                      + [str(w.value) for w in at.warning if "База данных недоступна" in str(w.value)],
+        "journal_reports": sum(1 for e in at.expander if e.label.startswith("🏢")),
+        "lazy_imported": [m for m in LAZY_MODULES if m in sys.modules],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бюджет запуска и перезапуска приложения")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--companies", type=int, default=300)
+    parser.add_argument("--reports", type=int, default=50, help="отчётов текущего месяца в журнале")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.reruns, args.companies, args.reports)
+        return
+
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", "--reruns", str(args.reruns), "--companies", str(args.companies),
+         "--reports", str(args.reports)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+
+    print(f"Холодный старт:        {result['cold_start_s']:.2f} с (бюджет {BUDGET['cold_start_s']} с)")
+    print(f"Первый прогон:         {result['first_run_bytes'] / 1024:.1f} КБ")
+    print(f"Перезапуск p50 / max:  {result['rerun_p50_ms']:.0f} / {result['rerun_max_ms']:.0f} мс (бюджет p50 {BUDGET['rerun_p50_ms']} мс)")
+    print(f"Байт за перезапуск:    {result['rerun_bytes']:.0f} (бюджет {BUDGET['rerun_bytes']})")
+    print(f"Импортированы заранее: {', '.join(result['lazy_imported']) or 'нет'}")
+    print(f"Отчётов в журнале:     {result['journal_reports']} из {args.reports}")
+
+    failures = [key for key, limit in BUDGET.items() if result[key] > limit]
+    if result["lazy_imported"]:
+        failures.append("lazy_imported")
+    if result["journal_reports"] != args.reports:
+        failures.append("journal_reports")
+    if result["exceptions"]:
+        failures.append("exceptions: " + "; ".join(result["exceptions"]))
+    if failures:
+        print("ПРЕВЫШЕН БЮДЖЕТ: " + ", ".join(failures))
+        sys.exit(1)
+    print("Бюджет соблюдён")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+
+# ---------------------- ПОИСК КОМПАНИЙ ---------------------- #
+
+# Организационно-правовые формы не помогают различать компании, а только шумят
+LEGAL_FORMS = {"ооо", "оао", "зао", "пао", "ао", "ип", "нко", "llc", "ltd", "inc"}
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize_name(name):
+    """Нормализованное название: нижний регистр, ё→е, без кавычек, пунктуации и ОПФ"""
+    words = _NON_WORD_RE.sub(" ", name.lower().replace("ё", "е")).split()
+    return " ".join(w for w in words if w not in LEGAL_FORMS)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanyIndex:
+    """Триграммный индекс названий компаний для поиска по мере ввода.
+
+    Строится один раз на снимок таблицы. Поиск считает общие триграммы
+    запроса с каждым названием через bincount по спискам вхождений,
+    ранжирует по коэффициенту Дайса и поднимает совпадения по префиксу
+    названия или слова (bisect по отсортированным ключам) — так находятся
+    и опечатки, и названия, набранные не с начала.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        normalized = [normalize_name(n) for n in self.names]
+        postings = {}
+        sizes = np.empty(len(self.names), dtype=np.int32)
+        word_starts = []
+        for i, norm in enumerate(normalized):
+            grams = _trigrams(norm)
+            sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+            word_starts.extend((norm[m.start():], i) for m in re.finditer(r" \w", norm))
+        self._postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self._sizes = sizes
+        # Отсортированные названия и «хвосты» с начала каждого слова: префиксный поиск — bisect
+        by_name = sorted(range(len(normalized)), key=normalized.__getitem__)
+        self._prefix_keys = [normalized[i] for i in by_name]
+        self._prefix_ids = np.asarray(by_name, dtype=np.int32)
+        word_starts.sort()
+        self._word_keys = [key for key, _ in word_starts]
+        self._word_ids = np.asarray([i for _, i in word_starts], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        return bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff")
+
+    def search(self, query, limit=20, min_score=0.2):
+        """Названия компаний, лучше всего совпадающие с запросом (по убыванию)"""
+        norm = normalize_name(query)
+        if not norm or not self.names:
+            return []
+        grams = _trigrams(norm)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if lists:
+            common = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        else:
+            common = np.zeros(len(self.names), dtype=np.int64)
+        scores = 2.0 * common / (len(grams) + self._sizes)
+        
+        # Префикс названия или слова — сильный сигнал при наборе с начала
+        lo, hi = self._prefix_range(self._prefix_keys, norm)
+        scores[self._prefix_ids[lo:hi]] += 1.0
+        lo, hi = self._prefix_range(self._word_keys, " " + norm)
+        scores[self._word_ids[lo:hi]] += 0.5
+
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+        order = np.argsort(-scores[candidates], kind="stable")
+        return [self.names[i] for i in candidates[order]]
@@ -0,0 +1,163 @@
+import streamlit as st
+import time
+
+
+# ---------------------- БД (PostgreSQL) ---------------------- #
+
+# Реплика для чтения (необязательная секция st.secrets["postgres_replica"])
+REPLICA_MAX_LAG = 5          # секунд: при большем отставании читаем с основной БД
+PRIMARY_STICKY_SECONDS = 30  # после записи чтения сессии идут на основную БД
+PRIMARY_RETRY_SECONDS = 15   # после неудачного соединения чтения с таймаутом не ждут основную БД
+REPLICA_RETRY_SECONDS = 30   # после сбоя или отставания реплика не проверяется заново
+REPLICA_CONNECT_TIMEOUT = 3  # секунд: соединение с репликой для чтений без своего таймаута
+
+# Моменты time.monotonic(): до _primary_down_until основная БД считается недоступной
+# для чтений с таймаутом, до _replica_down_until реплика не используется, до
+# _replica_lag_ok_until отставание заведомо в пределах REPLICA_MAX_LAG (запрос не нужен)
+_primary_down_until = 0.0
+_replica_down_until = 0.0
+_replica_lag_ok_until = 0.0
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+# PostgreSQL connection
+def _params(cfg):
+    return dict(
+        host=cfg["host"],
+        database=cfg["database"],
+        user=cfg["user"],
+        password=cfg["password"],
+        port=cfg["port"]
+    )
+
+
+def _timeout_params(timeout):
+    """Таймауты соединения и каждого запроса для psycopg2.connect"""
+    return dict(connect_timeout=max(1, round(timeout)), options=f"-c statement_timeout={int(timeout * 1000)}")
+
+
+def get_db_connection(readonly=False, timeout=None):
+    """Соединение с БД: запись — основная, чтение (readonly=True) — реплика, если настроена.
+
+    timeout (секунды) ограничивает и соединение, и каждый запрос — для
+    чтений, которых ждёт экран. После неудачи такие чтения PRIMARY_RETRY_SECONDS
+    сразу получают DatabaseUnavailable, не дожидаясь таймаута снова.
+    """
+    global _primary_down_until
+    if readonly and "postgres_replica" in st.secrets and not reads_pinned_to_primary():
+        conn = _get_replica_connection(timeout)
+        if conn is not None:
+            return conn
+    
+    # psycopg2 импортируется при первом соединении, а не при старте приложения
+    import psycopg2
+    if timeout is None:
+        return psycopg2.connect(**_primary_params())
+    
+    if _primary_down_until > time.monotonic():
+        raise DatabaseUnavailable("основная БД не отвечает, повторная попытка чуть позже")
+    try:
+        return psycopg2.connect(**_timeout_params(timeout), **_primary_params())
+    except psycopg2.OperationalError:
+        _primary_down_until = time.monotonic() + PRIMARY_RETRY_SECONDS
+        raise
+
+
+def _primary_params():
+    if "postgres" in st.secrets:
+        return _params(st.secrets["postgres"])
+    else:
+        # Локальная разработка
+        return dict(
+            host="localhost",
+            database="service_score_journal",
+            user="postgres",
+            password="postgres"
+        )
+
+
+def create_db_pool(minconn, maxconn):
+    """Пул соединений с основной БД (для долгоживущих сервисов, см. ingest_api.py)"""
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(minconn, maxconn, **_primary_params())
+
+
+def _get_replica_connection(timeout=None):
+    """Соединение с репликой или None, если она недоступна или отстаёт.
+
+    timeout — как у get_db_connection: ограничивает соединение и каждый
+    запрос. Неудача (нет соединения, отставание) запоминается на
+    REPLICA_RETRY_SECONDS: в это время чтения сразу идут на основную БД,
+    не дожидаясь connect_timeout.
+    """
+    global _replica_down_until, _replica_lag_ok_until
+    if _replica_down_until > time.monotonic():
+        return None
+    import psycopg2
+    timeouts = _timeout_params(timeout) if timeout is not None else dict(connect_timeout=REPLICA_CONNECT_TIMEOUT)
+    try:
+        conn = psycopg2.connect(**timeouts, **_params(st.secrets["postgres_replica"]))
+    except Exception:
+        _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        return None
+    try:
+        conn.set_session(readonly=True, autocommit=True)
+        if _replica_lag_ok_until > time.monotonic():
+            return conn
+        cur = conn.cursor()
+        # NULL — не реплика (или ещё ничего не проиграно): считаем отставание нулевым
+        cur.execute("""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """)
+        (lag,) = cur.fetchone()
+        cur.close()
+        if lag > REPLICA_MAX_LAG:
+            conn.close()
+            _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+            return None
+        # Отставание растёт не быстрее времени: следующие REPLICA_MAX_LAG - lag секунд оно в пределах
+        _replica_lag_ok_until = time.monotonic() + REPLICA_MAX_LAG - float(lag)
+        return conn
+    except Exception:
+        conn.close()
+        _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        return None
+
+
+def reads_pinned_to_primary():
+    """Сессия недавно писала в БД и должна читать с основной"""
+    try:
+        return st.session_state.get("primary_pinned_until", 0) > time.time()
+    except Exception:
+        return False
+
+
+def read_cache_key():
+    """(readonly, pinned_until) — аргументы кэшируемых чтений текущей сессии.
+
+    Закреплённая сессия читает с основной БД: (False, 0). Иначе чтение идёт
+    с реплики, и в ключ входит конец последнего закрепления: запись в кэше
+    с этим ключом появляется только после него, когда реплика гарантированно
+    догнала запись сессии, — снимок, сделанный до записи, ей не достанется.
+    """
+    if reads_pinned_to_primary():
+        return False, 0
+    try:
+        return True, st.session_state.get("primary_pinned_until", 0)
+    except Exception:
+        return True, 0
+
+
+def pin_reads_to_primary():
+    """Закрепить чтения текущей сессии за основной БД, чтобы видеть свою запись"""
+    try:
+        st.session_state["primary_pinned_until"] = time.time() + PRIMARY_STICKY_SECONDS
+    except Exception:
+        # Вне сессии Streamlit (фоновый поток) закреплять нечего
+        pass
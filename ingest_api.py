@@ -0,0 +1,254 @@
+"""HTTP API для записи выездов без Streamlit (для инженеров в поле).
+
+    python ingest_api.py --port 8080
+    python ingest_api.py --companies-csv companies.csv   # справочник компаний из CSV (нагрузочный тест)
+
+    POST /visits                      {"company_name", "stations_checked", "planned_visits"}
+    POST /visits/bulk                 {"visits": [{...}, ...]}
+    GET  /companies/{name}/report
+    GET  /health
+
+Число станций компании (N) клиент не передаёт: оно берётся из Google Sheets,
+как в приложении, а компания не из таблицы — ошибка 400. Расчёт и запись —
+те же scoring.calc_flexible_score_dynamic и visits.apply_visit, что у
+приложения и очереди выездов. Запросы к БД идут через пул соединений в пуле
+потоков того же размера.
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import psycopg2
+from aiohttp import web
+from psycopg2.pool import PoolError
+
+from db import create_db_pool
+from scoring import calc_flexible_score_dynamic
+from sheets import load_companies_from_gsheet
+from visits import apply_visit, fetch_month_report
+
+
+DB_POOL_MIN = 2
+DB_POOL_MAX = 20
+BULK_MAX_VISITS = 500
+
+routes = web.RouteTableDef()
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class CompaniesUnavailable(Exception):
+    """Справочник компаний (Google Sheets) не загрузился"""
+
+
+def json_response(data, status=200):
+    # default=str — на случай NUMERIC/TIMESTAMP из БД
+    return web.json_response(data, status=status, dumps=lambda obj: json.dumps(obj, ensure_ascii=False, default=str))
+
+
+def _int_field(data, name, minimum):
+    value = data.get(name)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise BadRequest(f"{name}: ожидается целое число >= {minimum}")
+    return value
+
+
+def _parse_visit(data):
+    if not isinstance(data, dict):
+        raise BadRequest("выезд должен быть JSON-объектом")
+    company_name = data.get("company_name")
+    if not isinstance(company_name, str) or not company_name.strip():
+        raise BadRequest("company_name: обязательное поле")
+    return (
+        company_name,
+        _int_field(data, "stations_checked", 1),
+        _int_field(data, "planned_visits", 1),
+    )
+
+
+def _visit_response(company_name, month_year, applied):
+    results, total_score, max_score, month_percent, total_visits = applied
+    return {
+        "company_name": company_name,
+        "month_year": month_year,
+        "visit_number": total_visits,
+        "total_score": total_score,
+        "max_score": max_score,
+        "month_percent": month_percent,
+        "results": results,
+    }
+
+
+# ---------------------- СПРАВОЧНИК КОМПАНИЙ ---------------------- #
+
+def _load_stations(companies_csv=None):
+    """{компания: число станций} из Google Sheets (кэш 5 минут) или из CSV с колонками name, stations"""
+    try:
+        companies = pd.read_csv(companies_csv) if companies_csv else load_companies_from_gsheet()
+    except Exception as e:
+        raise CompaniesUnavailable(str(e)) from e
+    return dict(zip(companies["name"], companies["stations"].astype(int)))
+
+
+async def stations_for(request, company_names):
+    """N для каждой компании; компания не из справочника — BadRequest"""
+    app = request.app
+    stations = app["stations"]
+    if stations is None:
+        stations = await asyncio.get_running_loop().run_in_executor(app["executor"], _load_stations)
+    unknown = sorted(set(company_names) - set(stations))
+    if unknown:
+        raise BadRequest("company_name: нет в таблице клиентов: " + ", ".join(unknown))
+    return [stations[name] for name in company_names]
+
+
+# ---------------------- БД (в пуле потоков) ---------------------- #
+
+def _in_transaction(pool, fn, *args):
+    conn = pool.getconn()
+    try:
+        cur = conn.cursor()
+        result = fn(cur, *args)
+        conn.commit()
+        cur.close()
+        return result
+    except Exception:
+        # Оборванное соединение (перезапуск БД) не откатить: rollback заменил бы
+        # OperationalError (503) на InterfaceError «connection already closed» (500)
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        # Закрытое соединение в пул не возвращаем — следующий запрос получит новое
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def _append_visits(cur, month_year, visits):
+    """Записать выезды одной транзакцией (порядок внутри компании сохраняется)"""
+    applied = {}
+    # Порядок блокировок (компания, месяц), как требует apply_visit
+    order = sorted(range(len(visits)), key=lambda i: (visits[i][0], month_year))
+    for i in order:
+        company_name, stations_checked, K, N = visits[i]
+        # Запрос не повторяется очередью, поэтому дата — не ключ идемпотентности
+        applied[i] = apply_visit(cur, company_name, month_year, stations_checked, K, N,
+                                 datetime.now().isoformat(), dedupe=False)
+    return [applied[i] for i in range(len(visits))]
+
+
+async def run_db(request, fn, *args):
+    app = request.app
+    return await asyncio.get_running_loop().run_in_executor(app["executor"], _in_transaction, app["pool"], fn, *args)
+
+
+# ---------------------- ОБРАБОТЧИКИ ---------------------- #
+
+@web.middleware
+async def json_errors(request, handler):
+    try:
+        return await handler(request)
+    except BadRequest as e:
+        return json_response({"error": str(e)}, status=400)
+    except json.JSONDecodeError:
+        return json_response({"error": "некорректный JSON"}, status=400)
+    except CompaniesUnavailable:
+        return json_response({"error": "таблица клиентов недоступна"}, status=503)
+    except (psycopg2.OperationalError, PoolError):
+        return json_response({"error": "база данных недоступна"}, status=503)
+    except psycopg2.Error as e:
+        return json_response({"error": str(e).strip()}, status=500)
+
+
+@routes.get("/health")
+async def health(request):
+    return json_response({"status": "ok"})
+
+
+@routes.post("/visits")
+async def append_visit(request):
+    company_name, stations_checked, K = _parse_visit(await request.json())
+    (N,) = await stations_for(request, [company_name])
+    visit = (company_name, stations_checked, K, N)
+    month_year = datetime.now().strftime("%Y-%m")
+    (applied,) = await run_db(request, _append_visits, month_year, [visit])
+    return json_response(_visit_response(visit[0], month_year, applied), status=201)
+
+
+@routes.post("/visits/bulk")
+async def append_visits_bulk(request):
+    data = await request.json()
+    visits = data.get("visits") if isinstance(data, dict) else None
+    if not isinstance(visits, list) or not visits:
+        raise BadRequest("visits: ожидается непустой список")
+    if len(visits) > BULK_MAX_VISITS:
+        raise BadRequest(f"visits: не больше {BULK_MAX_VISITS} за запрос")
+    visits = [_parse_visit(v) for v in visits]
+    stations = await stations_for(request, [v[0] for v in visits])
+    visits = [v + (N,) for v, N in zip(visits, stations)]
+    month_year = datetime.now().strftime("%Y-%m")
+    applied = await run_db(request, _append_visits, month_year, visits)
+    return json_response({
+        "visits": [_visit_response(v[0], month_year, a) for v, a in zip(visits, applied)]
+    }, status=201)
+
+
+@routes.get("/companies/{company_name}/report")
+async def current_month_report(request):
+    company_name = request.match_info["company_name"]
+    month_year = datetime.now().strftime("%Y-%m")
+    report = await run_db(request, fetch_month_report, company_name, month_year)
+    if report is None:
+        return json_response({"error": "отчёта за текущий месяц нет"}, status=404)
+    (N,) = await stations_for(request, [company_name])
+
+    results, _, _ = calc_flexible_score_dynamic(N, report["planned_visits"], report["facts"])
+    return json_response({
+        "company_name": company_name,
+        "month_year": month_year,
+        "stations_total": N,
+        "planned_visits": report["planned_visits"],
+        "facts": report["facts"],
+        "visit_dates": report["visit_dates"],
+        "total_score": report["total_score"],
+        "max_score": report["max_score"],
+        "month_percent": report["month_percent"],
+        "results": results,
+    })
+
+
+# ---------------------- ЗАПУСК ---------------------- #
+
+async def _db_pool(app):
+    app["pool"] = create_db_pool(DB_POOL_MIN, DB_POOL_MAX)
+    # Потоков не больше, чем соединений: пул никогда не исчерпывается
+    app["executor"] = ThreadPoolExecutor(max_workers=DB_POOL_MAX, thread_name_prefix="ingest-db")
+    yield
+    app["executor"].shutdown(wait=True)
+    app["pool"].closeall()
+
+
+def create_app(companies_csv=None):
+    app = web.Application(middlewares=[json_errors])
+    # CSV читается один раз; таблица клиентов — при запросах, с кэшем load_companies_from_gsheet
+    app["stations"] = _load_stations(companies_csv) if companies_csv else None
+    app.add_routes(routes)
+    app.cleanup_ctx.append(_db_pool)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP API для записи выездов")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--companies-csv", help="справочник компаний (name, stations) вместо Google Sheets")
+    args = parser.parse_args()
+    web.run_app(create_app(args.companies_csv), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
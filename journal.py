@@ -0,0 +1,182 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# ---------------------- ЖУРНАЛ ОТЧЁТОВ ---------------------- #
+
+# Архив хранит выезды массивами (INTEGER[], TIMESTAMP[]): для UNION ALL с reports
+# они приводятся к типам reports — JSON-текст и JSONB
+REPORTS_SELECT = """
+    SELECT id, created_at, company_name, month_year, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits
+    FROM reports
+"""
+ARCHIVE_SELECT = """
+    SELECT id, created_at, company_name, month_year, to_jsonb(facts)::text AS facts_json,
+           total_score, max_score, month_percent, to_jsonb(visit_dates) AS visit_dates, planned_visits
+    FROM reports_archive
+"""
+
+
+def table_exists(cur, name):
+    """Есть ли таблица: closed_months, reports_archive и month_results создаёт reports_maintenance.py,
+    и до его запуска журнал работает по одной reports"""
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return cur.fetchone()[0]
+
+
+def fetch_closed_months(cur):
+    """Закрытые месяцы (множество "YYYY-MM")"""
+    if not table_exists(cur, "closed_months"):
+        return set()
+    cur.execute("SELECT month_year FROM closed_months")
+    return {r[0] for r in cur.fetchall()}
+
+
+def fetch_reports(cur, company_name=None, include_closed=False):
+    """Строки журнала (поля REPORTS_SELECT), новые сверху.
+
+    С company_name — вся история компании, включая архив; иначе открытые
+    месяцы или (include_closed=True) все, включая архив.
+    """
+    archive = table_exists(cur, "reports_archive")
+    if company_name:
+        # История компании целиком, включая архив (по индексу company_name, month_year)
+        if archive:
+            cur.execute(f"""
+                {REPORTS_SELECT} WHERE company_name = %s
+                UNION ALL
+                {ARCHIVE_SELECT} WHERE company_name = %s
+                ORDER BY created_at DESC
+            """, (company_name, company_name))
+        else:
+            cur.execute(f"{REPORTS_SELECT} WHERE company_name = %s ORDER BY created_at DESC", (company_name,))
+    elif include_closed:
+        if archive:
+            cur.execute(f"""
+                {REPORTS_SELECT}
+                UNION ALL
+                {ARCHIVE_SELECT}
+                ORDER BY created_at DESC
+            """)
+        else:
+            cur.execute(f"{REPORTS_SELECT} ORDER BY created_at DESC")
+    else:
+        # Только открытые месяцы. Закрытые передаются константами — партиции
+        # именно этих месяцев отсекаются уже при планировании запроса
+        cur.execute(f"""
+            {REPORTS_SELECT}
+            WHERE month_year <> ALL(%s::text[])
+            ORDER BY created_at DESC
+        """, (sorted(fetch_closed_months(cur)),))
+    return cur.fetchall()
+
+
+def fetch_month_results(cur, month_years):
+    """Итоги закрытых месяцев: {report_id: (N, K, детальный расчёт)}"""
+    if not table_exists(cur, "month_results"):
+        return {}
+    cur.execute("""
+        SELECT report_id, stations, planned_visits, breakdown
+        FROM month_results WHERE month_year = ANY(%s)
+    """, (list(month_years),))
+    return {r[0]: (r[1], r[2], r[3]) for r in cur.fetchall()}
+
+
+def _parse_visit_date(value):
+    """Дата выезда или NaT; дата с часовым поясом — по своему местному времени"""
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return pd.NaT
+    if ts is pd.NaT:
+        return ts
+    return ts.tz_localize(None) if ts.tzinfo is not None else ts
+
+
+def _parse_visit_dates(dates):
+    """Даты выездов в datetime64[ns]; неразборчивые — NaT"""
+    try:
+        parsed = pd.to_datetime(pd.Series(dates, dtype=object), format="ISO8601", errors="coerce")
+    except (TypeError, ValueError):
+        # Даты с поясом вперемешку с датами без него разбираются по одной
+        parsed = pd.Series([_parse_visit_date(d) for d in dates], dtype="datetime64[ns]")
+    if getattr(parsed.dt, "tz", None) is not None:
+        parsed = parsed.dt.tz_localize(None)
+    return parsed.to_numpy(dtype="datetime64[ns]")
+
+
+class ReportsFrame:
+    """Журнал отчётов в компактном типизированном виде.
+
+    Поля отчётов лежат в DataFrame (company_name — категория, баллы —
+    целые), а выезды всех отчётов — в плоских массивах со смещениями:
+    станции отчёта i — facts[fact_offsets[i]:fact_offsets[i + 1]], даты —
+    аналогично через date_offsets. JSON разбирается один раз при загрузке.
+    """
+
+    def __init__(self, rows=()):
+        columns = {name: [] for name in ["id", "created_at", "company_name", "month_year", "total_score", "max_score", "month_percent", "planned_visits"]}
+        facts, fact_lens = [], []
+        dates, date_lens = [], []
+        
+        for report_id, created_at, company_name, month_year, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits in rows:
+            columns["id"].append(report_id)
+            columns["created_at"].append(created_at)
+            columns["company_name"].append(company_name)
+            columns["month_year"].append(month_year)
+            columns["total_score"].append(total_score or 0)
+            columns["max_score"].append(max_score or 0)
+            columns["month_percent"].append(month_percent or 0)
+            # Сохранённый K (плановое количество выездов), по умолчанию 4
+            columns["planned_visits"].append(planned_visits or 4)
+            
+            row_facts = json.loads(facts_json) if isinstance(facts_json, str) else (facts_json or [])
+            facts.extend(row_facts)
+            fact_lens.append(len(row_facts))
+            
+            # PostgreSQL JSONB возвращает уже распарсенный объект
+            if isinstance(visit_dates, str):
+                try:
+                    visit_dates = json.loads(visit_dates)
+                except ValueError:
+                    visit_dates = []
+            if not isinstance(visit_dates, list):
+                visit_dates = []
+            dates.extend(visit_dates)
+            date_lens.append(len(visit_dates))
+        
+        self.df = pd.DataFrame({
+            "id": pd.Series(columns["id"], dtype="int64"),
+            "created_at": pd.to_datetime(pd.Series(columns["created_at"], dtype=object)),
+            "company_name": pd.Series(columns["company_name"], dtype="category"),
+            "month_year": pd.Series(columns["month_year"], dtype="category"),
+            "total_score": pd.Series(columns["total_score"], dtype="int16"),
+            "max_score": pd.Series(columns["max_score"], dtype="int16"),
+            "month_percent": pd.Series(columns["month_percent"], dtype="float32"),
+            "planned_visits": pd.Series(columns["planned_visits"], dtype="int16"),
+        })
+        self.facts = np.asarray(facts, dtype=np.int32)
+        self.fact_offsets = np.concatenate(([0], np.cumsum(fact_lens, dtype=np.int64)))
+        self.visit_dates = _parse_visit_dates(dates)
+        self.date_offsets = np.concatenate(([0], np.cumsum(date_lens, dtype=np.int64)))
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def empty(self):
+        return len(self.df) == 0
+
+    def facts_of(self, i):
+        return self.facts[self.fact_offsets[i]:self.fact_offsets[i + 1]].tolist()
+
+    def dates_of(self, i):
+        """Даты выездов отчёта i (pd.Timestamp, NaT — если дата не разобралась)"""
+        return [pd.Timestamp(d) for d in self.visit_dates[self.date_offsets[i]:self.date_offsets[i + 1]]]
+
+    def memory_bytes(self):
+        return int(self.df.memory_usage(deep=True).sum()) + sum(
+            a.nbytes for a in (self.facts, self.fact_offsets, self.visit_dates, self.date_offsets)
+        )
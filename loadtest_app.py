@@ -0,0 +1,236 @@
+"""Нагрузочный тест Streamlit-приложения: N одновременных сессий на AppTest.
+
+    python loadtest_app.py --levels 1,5,10,20 --iterations 5
+
+Каждая сессия — отдельный процесс с AppTest и своим сценарием: выбрать
+компанию, сохранить выезд, дождаться выгрузки очереди выездов, открыть
+журнал компании, изменить выезд. Google Sheets подменяется списком
+тестовых компаний, БД — локальный PostgreSQL (--pg-*); если к нему нельзя
+подключиться, тест не запускается. Для каждого уровня одновременности
+печатает p50/p95/p99 длительности перезапуска скрипта по шагам, долю
+ошибок и число соединений с БД (pg_stat_activity), замеренное во время
+прогона.
+
+Ошибка шага — исключение скрипта, st.error, предупреждение «База данных
+недоступна», отсутствие отчёта компании в журнале или полей для правки.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_score_app.py")
+STEPS = ["open", "select_company", "save_visit", "queue_drain", "open_journal", "edit_visit"]
+DB_UNAVAILABLE = "База данных недоступна"
+
+
+class ScenarioError(Exception):
+    """Шаг сценария отработал без исключения, но не так, как ожидалось"""
+
+
+def fake_companies(count, prefix):
+    """Подмена load_companies_from_gsheet: тестовые компании без Google Sheets"""
+    import pandas as pd
+
+    df = pd.DataFrame({
+        "name": [f"{prefix} {i}" for i in range(count)],
+        "stations": [random.Random(i).randint(20, 200) for i in range(count)],
+    })
+    df.attrs["snapshot"] = int(pd.util.hash_pandas_object(df["name"], index=False).sum())
+    return df
+
+
+def check_app(at):
+    """Ошибки перезапуска, которые приложение показывает пользователю, а не бросает"""
+    if at.exception:
+        raise ScenarioError(at.exception[0].value)
+    if at.error:
+        raise ScenarioError(at.error[0].value)
+    for warning in at.warning:
+        if DB_UNAVAILABLE in warning.value:
+            raise ScenarioError(warning.value)
+
+
+def _timed(samples, step, action):
+    """Замерить перезапуск; action возвращает AppTest"""
+    started = time.perf_counter()
+    try:
+        check_app(action())
+        error = False
+    except ScenarioError as e:
+        print(f"{step}: {e}", file=sys.stderr)
+        error = True
+    except Exception:
+        traceback.print_exc()
+        error = True
+    samples.append((step, time.perf_counter() - started, error))
+
+
+def wait_for_queue(samples, queue, timeout):
+    """Дождаться выгрузки выездов сессии в БД (отдельно от замера журнала)"""
+    started = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    drained = queue.depth() == 0
+    if not drained:
+        print(f"queue_drain: очередь не выгружена за {timeout} с", file=sys.stderr)
+    samples.append(("queue_drain", time.perf_counter() - started, not drained))
+
+
+def run_session(session_id, args):
+    """Один пользователь: --iterations раз проходит сценарий. Возвращает [(шаг, секунды, ошибка)]."""
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    # До импорта visit_queue: путь очереди читается при импорте
+    os.environ["VISIT_QUEUE_PATH"] = os.path.join(args.queue_dir, f"queue_{session_id}.sqlite3")
+    import sheets
+    from streamlit.testing.v1 import AppTest
+    from visit_queue import QUEUE_PATH, VisitQueue
+
+    # Та же очередь, что у приложения в этом процессе: только для чтения глубины
+    queue = VisitQueue(QUEUE_PATH)
+    companies = fake_companies(args.companies, args.prefix)
+    sheets.load_companies_from_gsheet = lambda: companies.copy()
+
+    rnd = random.Random(session_id)
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.secrets["postgres"] = {
+        "host": args.pg_host, "port": args.pg_port, "database": args.pg_database,
+        "user": args.pg_user, "password": args.pg_password,
+    }
+    samples = []
+    _timed(samples, "open", at.run)
+
+    for _ in range(args.iterations):
+        company = companies["name"].iloc[rnd.randrange(len(companies))]
+        _timed(samples, "select_company", lambda: at.selectbox(key="company").select(company).run())
+
+        def save_visit():
+            at.number_input(key="stations_input").set_value(rnd.randint(1, 30))
+            return next(b for b in at.button if b.label.startswith("✅")).click().run()
+        _timed(samples, "save_visit", save_visit)
+        wait_for_queue(samples, queue, args.timeout)
+
+        def open_journal():
+            at.selectbox(key="journal_filter").select(company).run()
+            if not any(f"**{company}**" in e.label for e in at.expander):
+                raise ScenarioError(f"в журнале нет отчёта компании {company}")
+            return at
+        _timed(samples, "open_journal", open_journal)
+
+        def edit_visit():
+            inputs = [n for n in at.number_input if n.key and n.key.startswith("edit_")]
+            if not inputs:
+                raise ScenarioError(f"нет полей для правки выездов компании {company}")
+            field = inputs[0]
+            field.set_value(field.value + 1)
+            report_id = field.key.split("_")[1]
+            return at.button(key=f"save_{report_id}").click().run()
+        _timed(samples, "edit_visit", edit_visit)
+
+        time.sleep(rnd.uniform(0, args.think_time))
+
+    return samples
+
+
+def count_db_connections(args):
+    conn = psycopg2.connect(host=args.pg_host, port=args.pg_port, dbname=args.pg_database,
+                            user=args.pg_user, password=args.pg_password, connect_timeout=5)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()")
+    (count,) = cur.fetchone()
+    conn.close()
+    return count
+
+
+def sample_db_connections(args, stop, samples):
+    while not stop.is_set():
+        try:
+            samples.append(count_db_connections(args))
+        except psycopg2.Error:
+            pass
+        stop.wait(args.sample_interval)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def run_level(sessions, args):
+    stop = threading.Event()
+    connections = []
+    sampler = threading.Thread(target=sample_db_connections, args=(args, stop, connections), daemon=True)
+    sampler.start()
+
+    started = time.perf_counter()
+    # spawn: у каждой сессии свой чистый runtime Streamlit
+    with ProcessPoolExecutor(max_workers=sessions, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = list(pool.map(run_session, range(sessions), [args] * sessions))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+
+    by_step = defaultdict(list)
+    errors = defaultdict(int)
+    for samples in results:
+        for step, seconds, error in samples:
+            by_step[step].append(seconds)
+            errors[step] += error
+
+    total = sum(len(v) for step, v in by_step.items() if step != "queue_drain")
+    print(f"\n=== {sessions} сессий: {total} перезапусков за {elapsed:.1f} с, "
+          f"соединений с БД: max {max(connections, default=0)}, "
+          f"среднее {statistics.fmean(connections) if connections else 0:.1f}")
+    print(f"  {'шаг':15} {'n':>5} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'ошибки':>8}")
+    for step in STEPS:
+        values = sorted(by_step.get(step, []))
+        if not values:
+            continue
+        print(f"  {step:15} {len(values):5} {percentile(values, 50) * 1e3:9.0f} {percentile(values, 95) * 1e3:9.0f} "
+              f"{percentile(values, 99) * 1e3:9.0f} {errors[step] / len(values):8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Streamlit-приложения")
+    parser.add_argument("--levels", default="1,5,10,20", help="уровни одновременности через запятую")
+    parser.add_argument("--iterations", type=int, default=5, help="проходов сценария на сессию")
+    parser.add_argument("--companies", type=int, default=200)
+    parser.add_argument("--prefix", default="Нагрузочный тест")
+    parser.add_argument("--think-time", type=float, default=0.5, help="макс. пауза между проходами, с")
+    parser.add_argument("--timeout", type=float, default=60, help="таймаут одного перезапуска, с")
+    parser.add_argument("--sample-interval", type=float, default=0.2)
+    parser.add_argument("--pg-host", default="localhost")
+    parser.add_argument("--pg-port", type=int, default=5432)
+    parser.add_argument("--pg-database", default="service_score_journal")
+    parser.add_argument("--pg-user", default="postgres")
+    parser.add_argument("--pg-password", default="postgres")
+    args = parser.parse_args()
+
+    # Без БД приложение работает через очередь и предупреждения — замер был бы бессмысленным
+    try:
+        count_db_connections(args)
+    except psycopg2.Error as e:
+        sys.exit(f"PostgreSQL {args.pg_host}:{args.pg_port}/{args.pg_database} недоступен: {str(e).strip()}")
+
+    with tempfile.TemporaryDirectory(prefix="loadtest_queues_") as queue_dir:
+        args.queue_dir = queue_dir
+        for sessions in [int(x) for x in args.levels.split(",")]:
+            run_level(sessions, args)
+
+
+if __name__ == "__main__":
+    main()
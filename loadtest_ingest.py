@@ -0,0 +1,116 @@
+"""Нагрузочный тест HTTP API выездов (ingest_api.py).
+
+    python loadtest_ingest.py --write-companies-csv companies.csv    # справочник тестовых компаний
+    python ingest_api.py --companies-csv companies.csv
+    python loadtest_ingest.py --url http://localhost:8080 --concurrency 50 --requests 5000
+
+Каждый запрос — случайный выезд по одной из --companies тестовых компаний
+(одиночный или пачкой при --bulk N) и, с долей --read-ratio, чтение отчёта.
+Печатает пропускную способность, перцентили задержки и ошибки по кодам.
+"""
+import argparse
+import asyncio
+import csv
+import random
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def random_visit(args):
+    return {
+        "company_name": f"{args.prefix} {random.randrange(args.companies)}",
+        "stations_checked": random.randint(1, 30),
+        "planned_visits": 4,
+    }
+
+
+def write_companies_csv(path, args):
+    """Справочник тестовых компаний для ingest_api.py --companies-csv"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "stations"])
+        for i in range(args.companies):
+            writer.writerow([f"{args.prefix} {i}", 100])
+
+
+async def one_request(session, args):
+    if random.random() < args.read_ratio:
+        company = f"{args.prefix} {random.randrange(args.companies)}"
+        return "report", session.get(f"{args.url}/companies/{company}/report")
+    if args.bulk > 1:
+        return "bulk", session.post(f"{args.url}/visits/bulk", json={"visits": [random_visit(args) for _ in range(args.bulk)]})
+    return "visit", session.post(f"{args.url}/visits", json=random_visit(args))
+
+
+async def worker(session, args, counter, latencies, statuses):
+    while True:
+        if counter[0] >= args.requests:
+            return
+        counter[0] += 1
+        kind, request = await one_request(session, args)
+        started = time.perf_counter()
+        try:
+            async with request as response:
+                await response.read()
+                statuses[(kind, response.status)] += 1
+        except aiohttp.ClientError as e:
+            statuses[(kind, type(e).__name__)] += 1
+        latencies[kind].append(time.perf_counter() - started)
+
+
+async def main_async(args):
+    latencies = {"visit": [], "bulk": [], "report": []}
+    statuses = Counter()
+    counter = [0]
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session, args, counter, latencies, statuses) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"Запросов: {total} за {elapsed:.1f} с — {total / elapsed:.0f} запр/с при {args.concurrency} одновременных")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        print(f"  {kind:6} n={len(values):6}  mean={statistics.fmean(values) * 1e3:7.1f} мс  "
+              f"p50={percentile(values, 50) * 1e3:7.1f}  p95={percentile(values, 95) * 1e3:7.1f}  "
+              f"p99={percentile(values, 99) * 1e3:7.1f}  max={values[-1] * 1e3:7.1f}")
+    print("Ответы:")
+    for (kind, status), count in sorted(statuses.items(), key=str):
+        print(f"  {kind:6} {status}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP API выездов")
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--companies", type=int, default=200, help="число тестовых компаний")
+    parser.add_argument("--prefix", default="Нагрузочный тест", help="префикс названий тестовых компаний")
+    parser.add_argument("--bulk", type=int, default=1, help="выездов в одном запросе (>1 — /visits/bulk)")
+    parser.add_argument("--read-ratio", type=float, default=0.2, help="доля запросов чтения отчёта")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--write-companies-csv", metavar="PATH", help="записать справочник тестовых компаний и выйти")
+    args = parser.parse_args()
+    if args.write_companies_csv:
+        write_companies_csv(args.write_companies_csv, args)
+        print(f"Справочник {args.companies} тестовых компаний: {args.write_companies_csv}")
+        return
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
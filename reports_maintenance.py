@@ -0,0 +1,529 @@
+"""Обслуживание таблицы reports: помесячные партиции, закрытие и архив месяцев.
+
+    python reports_maintenance.py migrate               # перевести reports на партиции
+    python reports_maintenance.py ensure-partitions     # создать партиции на месяцы вперёд
+    python reports_maintenance.py close 2025-01         # итоговый расчёт, карточки и закрытие месяца
+    python reports_maintenance.py freeze 2025-01        # то же, что close
+    python reports_maintenance.py archive 2025-01       # перенести закрытый месяц в reports_archive
+
+Настройки подключения те же, что у приложения (st.secrets["postgres"]).
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from psycopg2 import errors, sql
+from psycopg2.extras import Json, execute_values
+
+from db import get_db_connection
+from journal import table_exists
+from scoring import calc_flexible_score_dynamic
+from sheets import load_companies_from_gsheet
+from visits import add_months
+
+
+MIGRATION_BATCH_SIZE = 5000
+PARTITIONS_AHEAD = 3        # сколько будущих месяцев держать созданными
+SWAP_LOCK_TIMEOUT = "2s"    # не ждём блокировку reports дольше, чтобы не копить очередь запросов
+SWAP_LOCK_ATTEMPTS = 10     # попыток взять блокировку для переключения таблиц
+SWAP_RETRY_DELAY = 1        # секунд, растёт с каждой попыткой
+
+REPORT_CARDS_DIR = "report_cards"
+
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+REPORT_COLUMNS = "id, created_at, company_name, month_year, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits"
+
+
+# ---------------------- СХЕМА ---------------------- #
+
+def create_partitioned_table(cur, table):
+    """Создать партиционированную по month_year таблицу отчётов и общие объекты"""
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS reports_id_seq")
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id BIGINT NOT NULL DEFAULT nextval('reports_id_seq'),
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            company_name TEXT NOT NULL,
+            month_year TEXT NOT NULL DEFAULT to_char(NOW(), 'YYYY-MM'),
+            facts_json TEXT NOT NULL,
+            total_score INTEGER,
+            max_score INTEGER,
+            month_percent REAL,
+            visit_dates JSONB,
+            planned_visits INTEGER DEFAULT 4,
+            PRIMARY KEY (id, month_year)
+        ) PARTITION BY LIST (month_year)
+    """).format(table=sql.Identifier(table)))
+    # Индексы объявлены на родителе и создаются в каждой партиции
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} (company_name, month_year, created_at DESC)").format(
+        name=sql.Identifier(f"{table}_company_month_idx"), table=sql.Identifier(table)))
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} (created_at DESC)").format(
+        name=sql.Identifier(f"{table}_created_at_idx"), table=sql.Identifier(table)))
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS reports_default PARTITION OF {table} DEFAULT").format(
+        table=sql.Identifier(table)))
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS closed_months (
+            month_year TEXT PRIMARY KEY,
+            closed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            archived BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    """)
+    # Компактный архив закрытых месяцев: массивы вместо JSON
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reports_archive (
+            id BIGINT PRIMARY KEY,
+            created_at TIMESTAMP NOT NULL,
+            company_name TEXT NOT NULL,
+            month_year TEXT NOT NULL,
+            facts INTEGER[] NOT NULL,
+            total_score SMALLINT,
+            max_score SMALLINT,
+            month_percent REAL,
+            visit_dates TIMESTAMP[],
+            planned_visits SMALLINT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS reports_archive_company_month_idx ON reports_archive (company_name, month_year)")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION reports_frozen_guard() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION 'Месяц % закрыт, отчёты доступны только для чтения', TG_ARGV[0];
+        END
+        $$ LANGUAGE plpgsql
+    """)
+
+
+def partition_name(month_year):
+    if not MONTH_RE.match(month_year):
+        raise ValueError(f"Неверный месяц: {month_year!r}, ожидается YYYY-MM")
+    return "reports_" + month_year.replace("-", "_")
+
+
+def ensure_partition(cur, month_year, table="reports"):
+    """Создать партицию месяца, перенеся в неё строки, успевшие попасть в reports_default"""
+    name = partition_name(month_year)
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0] is not None:
+        return False
+
+    cur.execute(sql.SQL("CREATE TABLE {part} (LIKE {table} INCLUDING DEFAULTS)").format(
+        part=sql.Identifier(name), table=sql.Identifier(table)))
+    cur.execute(sql.SQL("""
+        WITH moved AS (DELETE FROM reports_default WHERE month_year = %s RETURNING *)
+        INSERT INTO {part} SELECT * FROM moved
+    """).format(part=sql.Identifier(name)), (month_year,))
+    cur.execute(sql.SQL("ALTER TABLE {table} ATTACH PARTITION {part} FOR VALUES IN ({month})").format(
+        table=sql.Identifier(table), part=sql.Identifier(name), month=sql.Literal(month_year)))
+    return True
+
+
+def ensure_partitions(conn, ahead=PARTITIONS_AHEAD, table="reports"):
+    current_month = datetime.now().strftime("%Y-%m")
+    cur = conn.cursor()
+    created = []
+    for n in range(ahead + 1):
+        month_year = add_months(current_month, n)
+        if ensure_partition(cur, month_year, table):
+            created.append(month_year)
+        conn.commit()
+    cur.close()
+    return created
+
+
+# ---------------------- МИГРАЦИЯ ---------------------- #
+
+def _table_kind(cur, table):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _require_partitioned(cur):
+    """Закрытие и архив работают с партициями: до migrate reports — обычная таблица"""
+    if _table_kind(cur, "reports") != "p":
+        raise RuntimeError("reports ещё не разбита на партиции, сначала выполните migrate")
+
+
+def _copy_ids(cur, ids):
+    """Перекопировать строки с указанными id из старой таблицы в новую"""
+    cur.execute("DELETE FROM reports_partitioned WHERE id = ANY(%s)", (ids,))
+    cur.execute(f"""
+        INSERT INTO reports_partitioned ({REPORT_COLUMNS})
+        SELECT id, created_at, company_name, COALESCE(month_year, to_char(created_at, 'YYYY-MM')),
+               facts_json, total_score, max_score, month_percent, visit_dates, COALESCE(planned_visits, 4)
+        FROM reports WHERE id = ANY(%s)
+    """, (ids,))
+
+
+def _replay_changes(cur, limit=None):
+    """Применить изменения старой таблицы, накопленные триггером во время копирования"""
+    query = "DELETE FROM reports_migration_changes WHERE id IN (SELECT id FROM reports_migration_changes ORDER BY id{}) RETURNING id"
+    cur.execute(query.format(f" LIMIT {int(limit)}" if limit else ""))
+    ids = [r[0] for r in cur.fetchall()]
+    if ids:
+        _copy_ids(cur, ids)
+    return len(ids)
+
+
+def migrate(conn, batch_size=MIGRATION_BATCH_SIZE):
+    """Перевести reports на помесячные партиции без долгих блокировок.
+
+    Строки копируются пачками по id в отдельных транзакциях, изменения
+    за время копирования ловит триггер. Под короткой блокировкой остаётся
+    только догнать последние изменения и переименовать таблицы (см. _lock_for_swap).
+    """
+    cur = conn.cursor()
+    kind = _table_kind(cur, "reports")
+    if kind == "p":
+        print("reports уже партиционирована")
+        return
+    if kind is None:
+        # Чистая установка: сразу создаём партиционированную таблицу
+        create_partitioned_table(cur, "reports")
+        conn.commit()
+        ensure_partitions(conn)
+        print("Создана партиционированная таблица reports")
+        return
+
+    # 1. Новая таблица, журнал изменений и триггер на старой
+    create_partitioned_table(cur, "reports_partitioned")
+    cur.execute("CREATE TABLE IF NOT EXISTS reports_migration_changes (id BIGINT PRIMARY KEY)")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION reports_capture_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO reports_migration_changes VALUES (OLD.id) ON CONFLICT DO NOTHING;
+            ELSE
+                INSERT INTO reports_migration_changes VALUES (NEW.id) ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS reports_capture_change ON reports")
+    cur.execute("""
+        CREATE TRIGGER reports_capture_change AFTER INSERT OR UPDATE OR DELETE ON reports
+        FOR EACH ROW EXECUTE FUNCTION reports_capture_change()
+    """)
+    conn.commit()
+
+    # 2. Партиции под все месяцы, которые есть в данных, и на будущее
+    cur.execute("SELECT DISTINCT COALESCE(month_year, to_char(created_at, 'YYYY-MM')) FROM reports")
+    months = sorted({r[0] for r in cur.fetchall()})
+    for month_year in months:
+        ensure_partition(cur, month_year, "reports_partitioned")
+        conn.commit()
+    ensure_partitions(conn, table="reports_partitioned")
+
+    # 3. Копирование пачками по id
+    last_id, copied = 0, 0
+    while True:
+        cur.execute("SELECT id FROM reports WHERE id > %s ORDER BY id LIMIT %s", (last_id, batch_size))
+        ids = [r[0] for r in cur.fetchall()]
+        if not ids:
+            break
+        _copy_ids(cur, ids)
+        conn.commit()
+        last_id = ids[-1]
+        copied += len(ids)
+        print(f"Скопировано {copied} отчётов")
+
+    # 4. Догоняем изменения, пока их не станет мало
+    while _replay_changes(cur, batch_size) >= batch_size:
+        conn.commit()
+    conn.commit()
+
+    # 5. Короткое переключение под блокировкой
+    _lock_for_swap(conn, cur, batch_size)
+    _replay_changes(cur)
+    cur.execute("DROP TRIGGER reports_capture_change ON reports")
+    cur.execute("ALTER TABLE reports ALTER COLUMN id DROP DEFAULT")
+    cur.execute("ALTER TABLE reports RENAME TO reports_legacy")
+    cur.execute("ALTER TABLE reports_partitioned RENAME TO reports")
+    cur.execute("SELECT setval('reports_id_seq', GREATEST((SELECT COALESCE(MAX(id), 0) FROM reports), 1))")
+    cur.execute("ALTER SEQUENCE reports_id_seq OWNED BY reports.id")
+    cur.execute("DROP TABLE reports_migration_changes")
+    cur.execute("DROP FUNCTION reports_capture_change()")
+    conn.commit()
+    cur.close()
+    print(f"Готово: {copied} отчётов в партиционированной reports, старая таблица — reports_legacy")
+
+
+def _lock_for_swap(conn, cur, batch_size):
+    """Взять ACCESS EXCLUSIVE на reports для переключения таблиц.
+
+    DROP DEFAULT и RENAME всё равно требуют ACCESS EXCLUSIVE, а повышение
+    более слабой блокировки встало бы в очередь за читателями и держало бы
+    за собой все новые запросы. Поэтому блокировка берётся сразу и ждётся
+    не дольше SWAP_LOCK_TIMEOUT: столько (плюс само переключение) ждут
+    чтения и записи reports. Не удалось — откат, догоняем изменения и повтор.
+    """
+    for attempt in range(1, SWAP_LOCK_ATTEMPTS + 1):
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        try:
+            cur.execute("LOCK TABLE reports IN ACCESS EXCLUSIVE MODE")
+            return
+        except errors.LockNotAvailable:
+            conn.rollback()
+        print(f"reports занята, повтор переключения ({attempt}/{SWAP_LOCK_ATTEMPTS})")
+        time.sleep(SWAP_RETRY_DELAY * attempt)
+        while _replay_changes(cur, batch_size) >= batch_size:
+            conn.commit()
+        conn.commit()
+    raise RuntimeError("Не удалось заблокировать reports для переключения; migrate можно запустить повторно")
+
+
+# ---------------------- ЗАКРЫТИЕ И АРХИВ ---------------------- #
+
+def freeze_month(conn, month_year):
+    """Закрыть месяц: партиция становится доступной только для чтения"""
+    if month_year >= datetime.now().strftime("%Y-%m"):
+        raise ValueError(f"Месяц {month_year} ещё не закончился")
+    name = partition_name(month_year)
+    cur = conn.cursor()
+    _require_partitioned(cur)
+    ensure_partition(cur, month_year)
+    cur.execute(sql.SQL("DROP TRIGGER IF EXISTS reports_frozen ON {part}").format(part=sql.Identifier(name)))
+    cur.execute(sql.SQL("""
+        CREATE TRIGGER reports_frozen BEFORE INSERT OR UPDATE OR DELETE ON {part}
+        FOR EACH ROW EXECUTE FUNCTION reports_frozen_guard({month})
+    """).format(part=sql.Identifier(name), month=sql.Literal(month_year)))
+    cur.execute("INSERT INTO closed_months (month_year) VALUES (%s) ON CONFLICT DO NOTHING", (month_year,))
+    conn.commit()
+    cur.close()
+
+
+def archive_month(conn, month_year):
+    """Перенести закрытый месяц в компактную reports_archive и удалить его партицию"""
+    name = partition_name(month_year)
+    cur = conn.cursor()
+    _require_partitioned(cur)
+    cur.execute("SELECT archived FROM closed_months WHERE month_year = %s", (month_year,))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Месяц {month_year} не закрыт, сначала выполните freeze")
+    if row[0]:
+        print(f"Месяц {month_year} уже в архиве")
+        return
+
+    cur.execute(sql.SQL("""
+        INSERT INTO reports_archive (id, created_at, company_name, month_year, facts, total_score, max_score, month_percent, visit_dates, planned_visits)
+        SELECT id, created_at, company_name, month_year,
+               ARRAY(SELECT jsonb_array_elements_text(facts_json::jsonb)::int),
+               total_score, max_score, month_percent,
+               ARRAY(SELECT jsonb_array_elements_text(COALESCE(visit_dates, '[]'::jsonb))::timestamp),
+               planned_visits
+        FROM {part}
+        ON CONFLICT (id) DO NOTHING
+    """).format(part=sql.Identifier(name)))
+    archived = cur.rowcount
+    cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cur.execute(sql.SQL("ALTER TABLE reports DETACH PARTITION {part}").format(part=sql.Identifier(name)))
+    cur.execute(sql.SQL("DROP TABLE {part}").format(part=sql.Identifier(name)))
+    cur.execute("UPDATE closed_months SET archived = TRUE WHERE month_year = %s", (month_year,))
+    conn.commit()
+    cur.close()
+    print(f"В архив перенесено {archived} отчётов за {month_year}")
+
+
+# ---------------------- ЗАКРЫТИЕ МЕСЯЦА ---------------------- #
+
+def create_month_results_table(cur):
+    """Итоговый расчёт закрытого месяца по каждому отчёту (с N и K на момент закрытия)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS month_results (
+            report_id BIGINT PRIMARY KEY,
+            month_year TEXT NOT NULL,
+            company_name TEXT NOT NULL,
+            stations INTEGER NOT NULL,
+            planned_visits INTEGER NOT NULL,
+            breakdown JSONB NOT NULL,
+            total_score INTEGER NOT NULL,
+            max_score INTEGER NOT NULL,
+            month_percent REAL NOT NULL,
+            closed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS month_results_month_idx ON month_results (month_year)")
+
+
+def _parse_facts(facts_json):
+    return json.loads(facts_json) if isinstance(facts_json, str) else list(facts_json or [])
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _score_report(report):
+    report_id, company_name, N, K, facts = report
+    results, total_score, month_percent = calc_flexible_score_dynamic(N, K, facts)
+    return report_id, company_name, N, K, results, total_score, len(facts) * 2, month_percent
+
+
+def _write_report_card(card):
+    """Карточка компании за месяц: CSV и, если установлен openpyxl, XLSX"""
+    path, results, total_score, max_score, month_percent = card
+    df = pd.DataFrame(results)
+    total = pd.DataFrame([{
+        "Выезд": "Итого",
+        "F": int(df["F"].sum()) if not df.empty else 0,
+        "Баллы": f"{total_score} из {max_score}",
+        "Факт.%": f"{month_percent}%",
+    }])
+    df = pd.concat([df, total], ignore_index=True)
+    # utf-8-sig — чтобы Excel корректно открыл кириллицу
+    df.to_csv(path + ".csv", index=False, encoding="utf-8-sig")
+    if importlib.util.find_spec("openpyxl") is not None:
+        df.to_excel(path + ".xlsx", index=False)
+    return path
+
+
+def _closed_state(cur, month_year):
+    """(закрыт, в архиве, есть итоги month_results) для месяца"""
+    if not table_exists(cur, "closed_months"):
+        return False, False, False
+    cur.execute("SELECT archived FROM closed_months WHERE month_year = %s", (month_year,))
+    row = cur.fetchone()
+    if row is None:
+        return False, False, False
+    has_results = False
+    if table_exists(cur, "month_results"):
+        cur.execute("SELECT EXISTS (SELECT 1 FROM month_results WHERE month_year = %s)", (month_year,))
+        has_results = cur.fetchone()[0]
+    return True, row[0], has_results
+
+
+def close_month(conn, month_year, cards_dir=REPORT_CARDS_DIR, workers=None):
+    """Закрыть месяц: пересчитать все отчёты, сохранить итог, сделать карточки и заморозить.
+
+    Расчёт и карточки выполняются в пуле процессов. Партиция месяца
+    блокируется от записи до чтения отчётов: итоги, финальные баллы в
+    reports и заморозка фиксируются одной транзакцией по тем же данным,
+    а запоздавшие выезды и правки ждут её и затем падают на заморозке.
+
+    Месяц, замороженный без итогов (freeze_month напрямую), дозакрывается:
+    итоги и карточки считаются по замороженной партиции или архиву, сами
+    отчёты уже не меняются.
+    """
+    partition_name(month_year)
+    if month_year >= datetime.now().strftime("%Y-%m"):
+        raise ValueError(f"Месяц {month_year} ещё не закончился")
+    cur = conn.cursor()
+    _require_partitioned(cur)
+    frozen, archived, has_results = _closed_state(cur, month_year)
+    if has_results:
+        print(f"Месяц {month_year} уже закрыт")
+        return
+
+    companies = load_companies_from_gsheet()
+    stations = dict(zip(companies["name"], companies["stations"].astype(int)))
+
+    if archived:
+        cur.execute("""
+            SELECT id, company_name, facts, COALESCE(NULLIF(planned_visits, 0), 4)
+            FROM reports_archive WHERE month_year = %s
+        """, (month_year,))
+    else:
+        ensure_partition(cur, month_year)
+        # Обычное чтение разрешено; запись и SELECT ... FOR UPDATE (apply_visit) ждут конца
+        # транзакции — иначе выезд успел бы взять строку и взаимно заблокироваться с UPDATE ниже
+        cur.execute(sql.SQL("LOCK TABLE {part} IN EXCLUSIVE MODE").format(
+            part=sql.Identifier(partition_name(month_year))))
+        cur.execute("""
+            SELECT id, company_name, facts_json, COALESCE(NULLIF(planned_visits, 0), 4)
+            FROM reports WHERE month_year = %s
+        """, (month_year,))
+    reports = [
+        (report_id, company_name, stations.get(company_name, 0), K, _parse_facts(facts_json))
+        for report_id, company_name, facts_json, K in cur.fetchall()
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        scored = list(pool.map(_score_report, reports, chunksize=64))
+
+    create_month_results_table(cur)
+    execute_values(cur, """
+        INSERT INTO month_results (report_id, month_year, company_name, stations, planned_visits, breakdown, total_score, max_score, month_percent)
+        VALUES %s
+    """, [
+        (report_id, month_year, company_name, N, K, Json(results, dumps=_dumps), total_score, max_score, month_percent)
+        for report_id, company_name, N, K, results, total_score, max_score, month_percent in scored
+    ])
+    if frozen:
+        # Партиция уже только для чтения: итог остаётся в month_results
+        conn.commit()
+    else:
+        # Финальные баллы в самих отчётах (created_at не трогаем)
+        execute_values(cur, """
+            UPDATE reports AS r
+            SET total_score = v.total_score, max_score = v.max_score, month_percent = v.month_percent
+            FROM (VALUES %s) AS v (id, month_year, total_score, max_score, month_percent)
+            WHERE r.id = v.id AND r.month_year = v.month_year
+        """, [
+            (report_id, month_year, total_score, max_score, month_percent)
+            for report_id, _, _, _, _, total_score, max_score, month_percent in scored
+        ])
+        # freeze_month фиксирует всю транзакцию
+        freeze_month(conn, month_year)
+    cur.close()
+    print(f"Месяц {month_year} закрыт: {len(scored)} отчётов")
+
+    os.makedirs(cards_dir, exist_ok=True)
+    cards = []
+    used = set()
+    for report_id, company_name, _, _, results, total_score, max_score, month_percent in scored:
+        name = month_year + "_" + re.sub(r"[^\w.-]+", "_", company_name).strip("_")
+        if name in used:
+            name = f"{name}_{report_id}"
+        used.add(name)
+        cards.append((os.path.join(cards_dir, name), results, total_score, max_score, month_percent))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        written = list(pool.map(_write_report_card, cards))
+    print(f"Карточки компаний: {len(written)} в {cards_dir}/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="перевести reports на помесячные партиции")
+    p.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    p = sub.add_parser("ensure-partitions", help="создать партиции текущего и будущих месяцев")
+    p.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD)
+    for command in ("close", "freeze"):
+        p = sub.add_parser(command, help="итоговый расчёт, карточки компаний и закрытие месяца")
+        p.add_argument("month_year")
+        p.add_argument("--cards-dir", default=REPORT_CARDS_DIR)
+        p.add_argument("--workers", type=int, default=None)
+    p = sub.add_parser("archive", help="перенести закрытый месяц в reports_archive")
+    p.add_argument("month_year")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    started = time.monotonic()
+    try:
+        if args.command == "migrate":
+            migrate(conn, args.batch_size)
+        elif args.command == "ensure-partitions":
+            created = ensure_partitions(conn, args.ahead)
+            print("Созданы партиции: " + (", ".join(created) if created else "нет новых"))
+        elif args.command in ("close", "freeze"):
+            # Месяц закрывается только вместе с итогами: без них close его уже не досчитал бы
+            close_month(conn, args.month_year, args.cards_dir, args.workers)
+        elif args.command == "archive":
+            archive_month(conn, args.month_year)
+    finally:
+        conn.close()
+    print(f"({time.monotonic() - started:.1f} с)")
+
+
+if __name__ == "__main__":
+    main()
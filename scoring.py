@@ -0,0 +1,52 @@
+# ------------------ РАСЧЁТ БАЛЛОВ ------------------ #
+
+def calc_flexible_score_dynamic(N, K, facts):
+    if N == 0 or K == 0 or len(facts) == 0:
+        return [], 0, 0
+
+    results = []
+    remaining_stations = N
+    remaining_visits = K
+    total_done = 0
+    total_score = 0
+
+    for i in range(len(facts)):
+        F_i = facts[i]
+        P_i = remaining_stations / remaining_visits if remaining_visits > 0 else 0
+        percent_visit = (F_i / P_i * 100) if P_i > 0 else 0
+
+        expected_progress = (i + 1) / K * 100
+        actual_progress = (total_done + F_i) / N * 100
+
+        if actual_progress >= expected_progress:
+            score = 2
+            status = "90+% хорошо (общий OK)"
+        else:
+            if percent_visit < 50:
+                score = 0
+                status = "<50% плохо"
+            elif percent_visit < 90:
+                score = 1
+                status = "50-90% нормально"
+            else:
+                score = 2
+                status = "90+% хорошо"
+
+        results.append({
+            "Выезд": i + 1,
+            "P": round(P_i, 1),
+            "F": F_i,
+            "%выезд": f"{round(percent_visit, 1)}%",
+            "Баллы": score,
+            "Ожид.%": f"{round(expected_progress, 1)}%",
+            "Факт.%": f"{round(actual_progress, 1)}%",
+            "Статус": status,
+        })
+
+        remaining_stations -= F_i
+        remaining_visits -= 1
+        total_done += F_i
+        total_score += score
+
+    month_percent = round(total_done / N * 100, 1)
+    return results, total_score, month_percent
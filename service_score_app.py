@@ -1,111 +1,85 @@
 import streamlit as st
-import psycopg2
 import json
+import logging
+import threading
+from collections import defaultdict
 from datetime import datetime
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-
-# ---------------------- КОНФИГУРАЦИЯ ---------------------- #
-SPREADSHEET_ID = "1048LAnXOi822I87iLgommj-181thuzktnvdhQmzUfho"
-SHEET_NAME = "Клиенты"
-
-# PostgreSQL connection
-def get_db_connection():
-    if "postgres" in st.secrets:
-        return psycopg2.connect(
-            host=st.secrets["postgres"]["host"],
-            database=st.secrets["postgres"]["database"],
-            user=st.secrets["postgres"]["user"],
-            password=st.secrets["postgres"]["password"],
-            port=st.secrets["postgres"]["port"]
-        )
-    else:
-        # Локальная разработка
-        return psycopg2.connect(
-            host="localhost",
-            database="service_score_journal",
-            user="postgres",
-            password="postgres"
-        )
+
+from company_search import CompanyIndex, normalize_name
+from db import get_db_connection, pin_reads_to_primary, read_cache_key
+from journal import ReportsFrame, fetch_closed_months, fetch_month_results, fetch_reports
+from scoring import calc_flexible_score_dynamic
+from sheets import load_companies_from_gsheet
+from trends import fetch_trends
+from visit_queue import QUEUE_PATH, VisitQueue
+from visits import add_months, fetch_month_report
+
+
+logger = logging.getLogger("service_score_app")
+
+
+# ---------------------- ОТЧЁТЫ МЕСЯЦА ---------------------- #
+
+def mark_primary_write(month_year=None):
+    """Сбросить кэш журнала и закрепить чтения сессии за основной БД"""
+    _fetch_reports.clear()
+    _fetch_current_month_report.clear()
+    if month_year:
+        touch_month(month_year)
+    pin_reads_to_primary()
+
+# Чтения, которых ждёт экран: медленная или недоступная БД не должна подвешивать
+# перезапуск скрипта и сохранение выезда (см. get_db_connection(timeout=...))
+CURRENT_REPORT_TIMEOUT = 2  # секунд: прогресс месяца и предварительный расчёт
+JOURNAL_READ_TIMEOUT = 10   # секунд: журнал и тренды
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_current_month_report(company_name, month_year, readonly, pinned_until):
+    # pinned_until — только часть ключа кэша (см. db.read_cache_key)
+    conn = get_db_connection(readonly=readonly, timeout=CURRENT_REPORT_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        report = fetch_month_report(cur, company_name, month_year)
+        cur.close()
+    finally:
+        conn.close()
+    return report
+
 
 def get_current_month_report(company_name):
-    """Получить отчёт текущего месяца для компании"""
-    from datetime import datetime
+    """Отчёт текущего месяца для компании (кэш и короткий таймаут; ошибки БД пробрасываются)"""
     current_month = datetime.now().strftime("%Y-%m")
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits
-        FROM reports 
-        WHERE company_name = %s AND month_year = %s
-        ORDER BY created_at DESC LIMIT 1
-    """, (company_name, current_month))
-    
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    if result:
-        visit_dates = result[5] if result[5] else []
-        planned_visits = result[6] if result[6] else 4
-        return {
-            'id': result[0],
-            'facts': json.loads(result[1]),
-            'total_score': result[2],
-            'max_score': result[3],
-            'month_percent': result[4],
-            'visit_dates': visit_dates,
-            'planned_visits': planned_visits
-        }
-    return None
+    return _fetch_current_month_report(company_name, current_month, *read_cache_key())
 
 def save_visit_report(company_name, stations_checked, K, N):
-    """Сохранить новый выезд и обновить месячный отчёт"""
+    """Поставить новый выезд в локальную очередь и вернуть предварительный расчёт.
+
+    Запись в PostgreSQL выполняет фоновый VisitQueue, поэтому медленная
+    или недоступная БД не блокирует экран и выезд не теряется.
+    """
     from datetime import datetime
     current_month = datetime.now().strftime("%Y-%m")
     current_datetime = datetime.now().isoformat()
     
-    # Получаем текущий отчёт месяца
-    current = get_current_month_report(company_name)
+    queue = get_visit_queue()
     
-    if current:
-        # Добавляем к существующему
-        facts = current['facts'] + [stations_checked]
-        visit_dates = current.get('visit_dates', []) + [current_datetime]
-    else:
-        # Первый выезд месяца
-        facts = [stations_checked]
-        visit_dates = [current_datetime]
+    # Текущие выезды месяца: из БД (кэш или чтение с коротким таймаутом) + ещё не выгруженные из очереди
+    try:
+        current = get_current_month_report(company_name)
+    except Exception:
+        current = None
+    facts = (current['facts'] if current else []) + queue.pending_facts(company_name, current_month)
+    facts = facts + [stations_checked]
     
-    # Пересчитываем баллы
+    queue.put(company_name, current_month, stations_checked, K, N, current_datetime)
+    mark_primary_write()
+    
+    # Предварительный расчёт баллов (окончательный сделает фоновая выгрузка)
     results, total_score, month_percent = calc_flexible_score_dynamic(N, K, facts)
     max_score = len(facts) * 2
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    if current:
-        # Обновляем существующий отчёт (K не меняем!)
-        cur.execute("""
-            UPDATE reports 
-            SET facts_json = %s, total_score = %s, max_score = %s, 
-                month_percent = %s, visit_dates = %s, created_at = NOW()
-            WHERE id = %s
-        """, (json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent, json.dumps(visit_dates), current['id']))
-    else:
-        # Создаём новый отчёт месяца (сохраняем K!)
-        cur.execute("""
-            INSERT INTO reports (company_name, month_year, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (company_name, current_month, json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent, json.dumps(visit_dates), K))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
-    
     return results, total_score, max_score, month_percent, len(facts)
 
 def update_visit_in_report(company_name, visit_index, new_value, K, N):
@@ -113,7 +87,12 @@ def update_visit_in_report(company_name, visit_index, new_value, K, N):
     from datetime import datetime
     current_month = datetime.now().strftime("%Y-%m")
     
-    current = get_current_month_report(company_name)
+    # Читаем с основной БД без кэша: по этим данным сразу будет запись
+    conn = get_db_connection()
+    cur = conn.cursor()
+    current = fetch_month_report(cur, company_name, current_month)
+    cur.close()
+    conn.close()
     if not current:
         return None
     
@@ -139,39 +118,12 @@ def update_visit_in_report(company_name, visit_index, new_value, K, N):
     """, (json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent, current['id']))
     
     conn.commit()
+    mark_primary_write(current_month)
     cur.close()
     conn.close()
     
     return results, total_score, max_score, month_percent
 
-# ---------------------- GOOGLE SHEETS ---------------------- #
-
-@st.cache_data(ttl=300)
-def load_companies_from_gsheet():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    
-    if "gcp_service_account" in st.secrets:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    else:
-        creds = ServiceAccountCredentials.from_json_keyfile_name("service_account.json", scope)
-    
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
-    data = sheet.get_all_values()
-    headers = data[0]
-    rows = data[1:]
-    df = pd.DataFrame(rows, columns=headers)
-    df = df[["Организация", "Количество раб.мест без серверов и доп.сервисов (обслуживаемых)"]]
-    df = df.rename(columns={
-        "Организация": "name",
-        "Количество раб.мест без серверов и доп.сервисов (обслуживаемых)": "stations"
-    })
-    df = df[df["name"].str.strip() != ""]
-    df["stations"] = pd.to_numeric(df["stations"], errors="coerce").fillna(0).astype(int)
-    return df[["name", "stations"]]
-
-
 # ---------------------- БД (PostgreSQL) ---------------------- #
 
 def save_report(company_name, facts, total_score, max_score, month_percent):
@@ -185,431 +137,187 @@ def save_report(company_name, facts, total_score, max_score, month_percent):
         (company_name, json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent)
     )
     conn.commit()
+    mark_primary_write(datetime.now().strftime("%Y-%m"))
+    cur.close()
+    conn.close()
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_reports(company_name, include_closed, readonly, pinned_until):
+    # pinned_until — только часть ключа кэша (см. db.read_cache_key)
+    conn = get_db_connection(readonly=readonly, timeout=JOURNAL_READ_TIMEOUT)
+    cur = conn.cursor()
+    rows = fetch_reports(cur, company_name, include_closed)
     cur.close()
     conn.close()
+    
+    reports = ReportsFrame(rows)
+    if len(reports):
+        # Один раз на загрузку журнала (результат кэшируется), не при каждом перезапуске
+        logger.info("Журнал: %d отчётов, %.0f КБ в памяти (≈ %.1f МБ на 100 тыс. отчётов)",
+                    len(reports), reports.memory_bytes() / 1024,
+                    reports.memory_bytes() / len(reports) * 100_000 / 1024 / 1024)
+    return reports
 
 
-def get_reports(company_name=None):
+def get_reports(company_name=None, include_closed=False):
+    """Журнал отчётов (ReportsFrame). Кэшируется до следующей записи в БД; ошибки БД пробрасываются."""
+    # Сессия, закреплённая за основной БД, кэшируется отдельно от реплики;
+    # снимки реплики не переживают собственную запись сессии (см. read_cache_key)
+    return _fetch_reports(company_name, include_closed, *read_cache_key())
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_closed_months():
+    """Закрытые месяцы (только чтение), см. reports_maintenance.py close"""
+    conn = get_db_connection(readonly=True, timeout=JOURNAL_READ_TIMEOUT)
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
-        if company_name:
-            cur.execute("""
-                SELECT id, created_at, company_name, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits
-                FROM reports WHERE company_name = %s ORDER BY created_at DESC
-            """, (company_name,))
-        else:
-            cur.execute("""
-                SELECT id, created_at, company_name, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits
-                FROM reports ORDER BY created_at DESC
-            """)
+        months = fetch_closed_months(cur)
+        cur.close()
+    finally:
+        conn.close()
+    return months
+
 
-        rows = cur.fetchall()
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_frozen_results(month_years):
+    conn = get_db_connection(readonly=True, timeout=JOURNAL_READ_TIMEOUT)
+    try:
+        cur = conn.cursor()
+        frozen = fetch_month_results(cur, month_years)
         cur.close()
+    finally:
         conn.close()
-        
-        df = pd.DataFrame(rows, columns=["id", "created_at", "company_name", "facts_json", "total_score", "max_score", "month_percent", "visit_dates", "planned_visits"])
-        return df
-    except:
-        return pd.DataFrame()
+    return frozen
+
+
+def get_frozen_results(month_years):
+    """Итоговые расчёты закрытых месяцев: {report_id: (N, K, детальный расчёт)}.
 
+    Итоги закрытого месяца не меняются; TTL нужен только месяцам, закрытым
+    без итогов, — их дозавершает reports_maintenance.py close.
+    """
+    if not month_years:
+        return {}
+    return _fetch_frozen_results(month_years)
 
-def delete_report(report_id):
+
+def delete_report(report_id, month_year=None):
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("DELETE FROM reports WHERE id = %s", (report_id,))
     conn.commit()
+    mark_primary_write(month_year)
     cur.close()
     conn.close()
 
 
-# ------------------ РАСЧЁТ БАЛЛОВ ------------------ #
+# ---------------------- ТРЕНДЫ ---------------------- #
 
-def calc_flexible_score_dynamic(N, K, facts):
-    if N == 0 or K == 0 or len(facts) == 0:
-        return [], 0, 0
+@st.cache_resource
+def _month_versions():
+    """Счётчики изменений по месяцам: ключ кэша трендов, чтобы запись в месяц сбрасывала только его диапазоны.
 
-    results = []
-    remaining_stations = N
-    remaining_visits = K
-    total_done = 0
-    total_score = 0
+    Общие для всех сессий и потока очереди выездов — поэтому под блокировкой.
+    """
+    return threading.Lock(), defaultdict(int)
 
-    for i in range(len(facts)):
-        F_i = facts[i]
-        P_i = remaining_stations / remaining_visits if remaining_visits > 0 else 0
-        percent_visit = (F_i / P_i * 100) if P_i > 0 else 0
 
-        expected_progress = (i + 1) / K * 100
-        actual_progress = (total_done + F_i) / N * 100
+def touch_month(month_year):
+    lock, versions = _month_versions()
+    with lock:
+        versions[month_year] += 1
+
+
+def month_versions_since(start_month):
+    """Снимок счётчиков с start_month: ((месяц, версия), ...)"""
+    lock, versions = _month_versions()
+    with lock:
+        return tuple(sorted((m, v) for m, v in versions.items() if m >= start_month))
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_trends_cached(company_name, start_month, versions, readonly, pinned_until):
+    # versions и pinned_until — только часть ключа кэша; TTL страхует от записей из других процессов (API)
+    conn = get_db_connection(readonly=readonly, timeout=JOURNAL_READ_TIMEOUT)
+    cur = conn.cursor()
+    df = fetch_trends(cur, start_month, company_name)
+    cur.close()
+    conn.close()
+    return df
+
+
+def get_trends(company_name=None, months=12):
+    """Динамика за последние months месяцев (по компании или по всем). Кэш на (компания, диапазон)."""
+    start_month = add_months(datetime.now().strftime("%Y-%m"), -(months - 1))
+    return _fetch_trends_cached(company_name, start_month, month_versions_since(start_month), *read_cache_key())
 
-        if actual_progress >= expected_progress:
-            score = 2
-            status = "90+% хорошо (общий OK)"
-        else:
-            if percent_visit < 50:
-                score = 0
-                status = "<50% плохо"
-            elif percent_visit < 90:
-                score = 1
-                status = "50-90% нормально"
-            else:
-                score = 2
-                status = "90+% хорошо"
 
-        results.append({
-            "Выезд": i + 1,
-            "P": round(P_i, 1),
-            "F": F_i,
-            "%выезд": f"{round(percent_visit, 1)}%",
-            "Баллы": score,
-            "Ожид.%": f"{round(expected_progress, 1)}%",
-            "Факт.%": f"{round(actual_progress, 1)}%",
-            "Статус": status,
-        })
+# ---------------------- ОЧЕРЕДЬ ВЫЕЗДОВ (write-behind) ---------------------- #
 
-        remaining_stations -= F_i
-        remaining_visits -= 1
-        total_done += F_i
-        total_score += score
+def _on_queue_flush(months):
+    # Выгруженные выезды теперь в БД: сбрасываем кэши, где их ещё нет
+    _fetch_reports.clear()
+    _fetch_current_month_report.clear()
+    for month_year in months:
+        touch_month(month_year)
 
-    month_percent = round(total_done / N * 100, 1)
-    return results, total_score, month_percent
+
+@st.cache_resource
+def get_visit_queue():
+    queue = VisitQueue(QUEUE_PATH, on_flush=_on_queue_flush)
+    queue.start()
+    return queue
+
+
+# ---------------------- ВЫБОР КОМПАНИИ ---------------------- #
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_company_index(snapshot, _companies_df):
+    """Индекс поиска компаний; пересобирается только при смене снимка таблицы"""
+    return CompanyIndex(_companies_df["name"].tolist())
+
+
+PICKER_DEFAULT_OPTIONS = 30  # без запроса в список попадают только первые названия, остальные — через поиск
+
+
+def company_picker(label, companies_df, key, extra_options=()):
+    """Поиск по мере ввода + выбор из найденных (ранжированных) компаний.
+
+    Пока у запроса есть совпадения, выбрана лучшая из них (extra_options
+    вроде «Все компании» скрыты). Без запроса — extra_options, текущий
+    выбор и первые PICKER_DEFAULT_OPTIONS компаний.
+    """
+    query = st.text_input(f"🔍 Поиск: {label.lower()}", key=f"{key}_search", placeholder="Начните вводить название…")
+    if normalize_name(query):
+        index = get_company_index(companies_df.attrs.get("snapshot"), companies_df)
+        hits = index.search(query, limit=50)
+        if hits:
+            return st.selectbox(label, hits, index=0, key=key)
+        st.caption(f"Ничего не найдено — показаны первые {PICKER_DEFAULT_OPTIONS} компаний, остальные ищите по названию")
+
+    options = list(extra_options) + companies_df["name"].head(PICKER_DEFAULT_OPTIONS).tolist()
+    current = st.session_state.get(key)
+    # Выбранная через поиск компания остаётся выбранной и после очистки запроса
+    if current is not None and current not in options and (companies_df["name"] == current).any():
+        options.insert(len(extra_options), current)
+    return st.selectbox(label, options, index=options.index(current) if current in options else 0, key=key)
 
 
 # ---------------------- UI ---------------------- #
 
 st.set_page_config(page_title="Баллы инженеров", layout="wide")
 
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-    }
-    
-    .stApp {
-        background: linear-gradient(135deg, #0f172a 0%, #1e293b 100%);
-        color: #f1f5f9;
-    }
-    
-    /* Заголовки */
-    h1 {
-        color: #ffffff !important;
-        font-weight: 700 !important;
-        font-size: 2.5rem !important;
-        letter-spacing: -0.02em;
-        margin-bottom: 2rem !important;
-        background: linear-gradient(135deg, #60a5fa 0%, #a78bfa 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-    }
-    
-    h2, h3 {
-        color: #f1f5f9 !important;
-        font-weight: 600 !important;
-    }
-    
-    /* Текст */
-    p, span, div, li {
-        color: #e2e8f0 !important;
-    }
-    
-    /* Лейблы */
-    .stSelectbox label, .stNumberInput label {
-        color: #cbd5e1 !important;
-        font-weight: 600 !important;
-        font-size: 0.875rem !important;
-        text-transform: uppercase;
-        letter-spacing: 0.05em;
-    }
-    
-    /* Поля ввода и селекты */
-    .stNumberInput > div > div > input {
-        background: rgba(30, 41, 59, 0.95) !important;
-        color: #f1f5f9 !important;
-        border: 1.5px solid rgba(100, 116, 139, 0.5) !important;
-        border-radius: 10px !important;
-        font-size: 1rem !important;
-        font-weight: 500 !important;
-        padding: 0.75rem 1rem !important;
-    }
-    
-    .stNumberInput > div > div > input:focus {
-        border-color: #60a5fa !important;
-        box-shadow: 0 0 0 3px rgba(96, 165, 250, 0.15) !important;
-    }
-    
-    /* Selectbox - основной контейнер */
-    .stSelectbox > div > div {
-        background: rgba(30, 41, 59, 0.95) !important;
-        border: 1.5px solid rgba(100, 116, 139, 0.5) !important;
-        border-radius: 10px !important;
-    }
-    
-    /* Selectbox - текст выбранного значения */
-    .stSelectbox [data-baseweb="select"] > div {
-        background: transparent !important;
-        color: #f1f5f9 !important;
-        font-weight: 500 !important;
-    }
-    
-    /* Selectbox - иконка стрелки */
-    .stSelectbox svg {
-        fill: #94a3b8 !important;
-    }
-    
-    /* Selectbox - выпадающее меню (popover) */
-    [data-baseweb="popover"] {
-        background: #1e293b !important;
-        border: 1px solid #334155 !important;
-        border-radius: 10px !important;
-        box-shadow: 0 10px 40px rgba(0, 0, 0, 0.5) !important;
-    }
-    
-    /* Selectbox - список опций */
-    [data-baseweb="menu"] {
-        background: #1e293b !important;
-    }
-    
-    /* Selectbox - каждая опция */
-    [role="option"],
-    [data-baseweb="menu"] li {
-        background: transparent !important;
-        color: #e2e8f0 !important;
-        padding: 0.75rem 1rem !important;
-        transition: all 0.2s ease !important;
-        font-weight: 500 !important;
-    }
-    
-    /* Selectbox - hover на опции */
-    [role="option"]:hover,
-    [data-baseweb="menu"] li:hover {
-        background: rgba(59, 130, 246, 0.25) !important;
-        color: #ffffff !important;
-    }
-    
-    /* Selectbox - выбранная опция */
-    [aria-selected="true"],
-    [data-baseweb="menu"] li[aria-selected="true"] {
-        background: rgba(59, 130, 246, 0.35) !important;
-        color: #ffffff !important;
-        font-weight: 600 !important;
-    }
-    
-    /* Selectbox - input внутри */
-    [data-baseweb="select"] input {
-        color: #f1f5f9 !important;
-    }
-    
-    /* Expander карточки */
-    .streamlit-expanderHeader {
-        background: linear-gradient(135deg, rgba(30, 41, 59, 0.95) 0%, rgba(51, 65, 85, 0.95) 100%) !important;
-        border: 1px solid rgba(100, 116, 139, 0.4) !important;
-        border-left: 3px solid #60a5fa !important;
-        border-radius: 12px !important;
-        color: #f1f5f9 !important;
-        font-weight: 600 !important;
-        padding: 1.25rem !important;
-        transition: all 0.3s ease;
-    }
-    
-     /* Содержимое expander */
-    .streamlit-expanderContent {
-        background: rgba(17, 24, 39, 0.5) !important;
-        border: 1px solid rgba(100, 116, 139, 0.3) !important;
-        border-top: none !important;
-        border-radius: 0 0 12px 12px !important;
-        padding: 1.5rem !important;
-    }
-    
-    /* Убираем белые фоны при hover */
-    .streamlit-expander:hover,
-    .streamlit-expanderHeader:hover,
-    details:hover {
-        background: transparent !important;
-    }
-    
-    details[open] > summary {
-        background: linear-gradient(135deg, rgba(51, 65, 85, 0.95) 0%, rgba(71, 85, 105, 0.95) 100%) !important;
-    }
-    
-    /* Кнопки Primary */
-    .stButton > button[kind="primary"] {
-        background: linear-gradient(135deg, #3b82f6 0%, #8b5cf6 100%) !important;
-        color: #ffffff !important;
-        border: none !important;
-        border-radius: 10px !important;
-        font-weight: 600 !important;
-        font-size: 0.95rem !important;
-        padding: 0.75rem 2rem !important;
-        box-shadow: 0 4px 20px rgba(59, 130, 246, 0.4);
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button[kind="primary"]:hover {
-        background: linear-gradient(135deg, #2563eb 0%, #7c3aed 100%) !important;
-        box-shadow: 0 8px 30px rgba(59, 130, 246, 0.6) !important;
-        transform: translateY(-2px);
-    }
-    
-    /* Кнопки обычные */
-    .stButton > button {
-        background: rgba(51, 65, 85, 0.9) !important;
-        color: #f1f5f9 !important;
-        border: 1px solid rgba(100, 116, 139, 0.5) !important;
-        border-radius: 10px !important;
-        font-weight: 500 !important;
-        transition: all 0.3s ease;
-    }
-    
-    .stButton > button:hover {
-        background: rgba(71, 85, 105, 1) !important;
-        border-color: #60a5fa !important;
-    }
-    
-    /* Таблицы */
-    .stDataFrame {
-        border: 1px solid rgba(100, 116, 139, 0.3);
-        border-radius: 12px;
-        overflow: hidden;
-        box-shadow: 0 4px 20px rgba(0, 0, 0, 0.4);
-    }
-    
-    .stDataFrame thead tr th {
-        background: rgba(30, 41, 59, 0.95) !important;
-        color: #60a5fa !important;
-        font-weight: 600 !important;
-        text-transform: uppercase;
-        letter-spacing: 0.05em;
-    }
-    
-    /* Метрики */
-    [data-testid="stMetricValue"] {
-        color: #ffffff !important;
-        font-weight: 700 !important;
-        font-size: 2.25rem !important;
-    }
-    
-    [data-testid="stMetricLabel"] {
-        color: #cbd5e1 !important;
-        font-weight: 500 !important;
-        text-transform: uppercase;
-        letter-spacing: 0.05em;
-    }
-    
-    [data-testid="stMetric"] {
-        background: rgba(30, 41, 59, 0.6);
-        padding: 1.5rem;
-        border-radius: 12px;
-        border: 1px solid rgba(100, 116, 139, 0.3);
-    }
-    
-    /* Info, Success, Error */
-    .stInfo {
-        background: rgba(59, 130, 246, 0.1) !important;
-        border: 1px solid rgba(96, 165, 250, 0.4) !important;
-        border-left: 4px solid #60a5fa !important;
-        border-radius: 10px !important;
-        color: #f1f5f9 !important;
-    }
-    
-    .stSuccess {
-        background: rgba(34, 197, 94, 0.1) !important;
-        border: 1px solid rgba(34, 197, 94, 0.4) !important;
-        border-left: 4px solid #22c55e !important;
-        border-radius: 10px !important;
-        color: #f1f5f9 !important;
-    }
-    
-    .stError {
-        background: rgba(239, 68, 68, 0.1) !important;
-        border: 1px solid rgba(239, 68, 68, 0.4) !important;
-        border-left: 4px solid #ef4444 !important;
-        border-radius: 10px !important;
-        color: #f1f5f9 !important;
-    }
-    
-    /* Табы */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 12px;
-        border-bottom: 1px solid rgba(100, 116, 139, 0.3);
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        border: none;
-        border-bottom: 3px solid transparent;
-        color: #94a3b8;
-        font-weight: 500;
-        padding: 1rem 1.5rem;
-    }
-    
-    .stTabs [data-baseweb="tab"]:hover {
-        color: #e2e8f0;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        border-bottom: 3px solid #60a5fa;
-        color: #ffffff;
-        font-weight: 600;
-    }
-    
-    /* Strong */
-    strong {
-        color: #ffffff !important;
-        font-weight: 600 !important;
-    }
-    
-    /* Caption */
-    .stCaption {
-        color: #64748b !important;
-        text-align: center;
-    }
-            
-    /* УСИЛЕННАЯ ФИКСАЦИЯ SELECTBOX */
-    div[data-baseweb="popover"] > div,
-    div[data-baseweb="popover"] ul,
-    [data-baseweb="menu"],
-    ul[role="listbox"] {
-        background-color: #1e293b !important;
-        background: #1e293b !important;
-    }
-    
-    div[data-baseweb="popover"] li,
-    [data-baseweb="menu"] > ul > li,
-    ul[role="listbox"] > li,
-    li[role="option"] {
-        background-color: transparent !important;
-        background: transparent !important;
-        color: #e2e8f0 !important;
-        font-weight: 500 !important;
-    }
-    
-    div[data-baseweb="popover"] li:hover,
-    [data-baseweb="menu"] > ul > li:hover,
-    ul[role="listbox"] > li:hover,
-    li[role="option"]:hover {
-        background-color: rgba(59, 130, 246, 0.25) !important;
-        background: rgba(59, 130, 246, 0.25) !important;
-        color: #ffffff !important;
-    }
-    
-    div[data-baseweb="popover"] li[aria-selected="true"],
-    [data-baseweb="menu"] > ul > li[aria-selected="true"],
-    ul[role="listbox"] > li[aria-selected="true"] {
-        background-color: rgba(59, 130, 246, 0.35) !important;
-        background: rgba(59, 130, 246, 0.35) !important;
-        color: #ffffff !important;
-        font-weight: 600 !important;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Тема — статический файл static/theme.css (server.enableStaticServing в .streamlit/config.toml):
+# браузер загружает и кэширует его один раз, а при перезапусках уходит только эта строка
+st.markdown("<style>@import url('app/static/theme.css');</style>", unsafe_allow_html=True)
 
 st.title("🏭 Расчёт баллов и журнал отчётов")
 
-# Инструкция
-with st.expander("📖 Как пользоваться системой", expanded=False):
+# Инструкция: текст отправляется в браузер, только пока переключатель включён
+# (содержимое свёрнутого expander уходит при каждом перезапуске)
+if st.toggle("📖 Как пользоваться системой", key="show_help"):
     st.markdown("""
     ### Быстрый старт
     
@@ -652,7 +360,7 @@ with st.expander("📖 Как пользоваться системой", expand
 
 st.markdown("---")
 
-tab_calc, tab_journal = st.tabs(["➕ Новый отчёт", "📋 Журнал отчётов"])
+tab_calc, tab_journal, tab_trends = st.tabs(["➕ Новый отчёт", "📋 Журнал отчётов", "📈 Тренды"])
 
 with tab_calc:
     st.subheader("Добавить выезд")
@@ -666,27 +374,34 @@ with tab_calc:
     if companies_df.empty:
         st.info("Нет данных из Google Sheets.")
     else:
-        company_names = companies_df["name"].tolist()
-        selected_name = st.selectbox("Компания", company_names)
+        selected_name = company_picker("Компания", companies_df, key="company")
         company_row = companies_df[companies_df["name"] == selected_name].iloc[0]
         N = int(company_row["stations"])
         
         st.write(f"📍 Станций по договору: **{N}**")
         K = st.number_input("Выездов в месяц (K)", min_value=1, value=4)
 
-        # Показываем текущий прогресс
-        current_report = get_current_month_report(selected_name)
+        # Показываем текущий прогресс (с учётом выездов, ещё стоящих в очереди)
+        visit_queue = get_visit_queue()
+        try:
+            current_report = get_current_month_report(selected_name)
+        except Exception as e:
+            st.warning(f"⚠️ База данных недоступна, выезды сохраняются в локальную очередь: {e}")
+            current_report = None
+        pending = visit_queue.pending_facts(selected_name, datetime.now().strftime("%Y-%m"))
         
-        if current_report:
-            facts = current_report['facts']
+        if current_report or pending:
+            facts = (current_report['facts'] if current_report else []) + pending
             visit_num = len(facts) + 1
             total_checked = sum(facts)
             
+            _, total_score, month_percent = calc_flexible_score_dynamic(N, K, facts)
+            
             st.info(f"""
             **Текущий месяц:**
             - Выездов уже сделано: **{len(facts)} из {K}**
-            - Станций проверено: **{total_checked} из {N}** ({current_report['month_percent']}%)
-            - Баллы: **{current_report['total_score']} из {current_report['max_score']}**
+            - Станций проверено: **{total_checked} из {N}** ({month_percent}%)
+            - Баллы: **{total_score} из {len(facts) * 2}**
             """)
             
             st.write(f"🚀 Сейчас: **Выезд #{visit_num}**")
@@ -718,50 +433,76 @@ with tab_calc:
                 c3.metric("Выездов", f"{total_visits} из {K}")
             else:
                 st.error("Укажите количество проверенных станций!")
+        
+        queue_depth = visit_queue.depth()
+        if queue_depth:
+            st.caption(f"⏳ В очереди на запись в БД: {queue_depth}")
+            if visit_queue.last_error:
+                st.caption(f"Последняя ошибка БД: {visit_queue.last_error}")
+        dead_visits = visit_queue.dead_visits()
+        if dead_visits:
+            st.warning(
+                f"⚠️ Не записано выездов: {len(dead_visits)} — их месяц уже закрыт. "
+                f"Они сохранены в таблице dead_visits файла {visit_queue.path}."
+            )
 
 with tab_journal:
     st.subheader("📋 Журнал всех отчётов")
 
     try:
         companies_df = load_companies_from_gsheet()
-        names = ["Все компании"] + companies_df["name"].tolist()
-        filter_company = st.selectbox("Фильтр", names, key="journal_filter")
+        filter_company = company_picker("Фильтр", companies_df, key="journal_filter", extra_options=["Все компании"])
         filter_company = None if filter_company == "Все компании" else filter_company
     except:
         filter_company = None
 
-    reports_df = get_reports(filter_company)
+    include_closed = False
+    if filter_company is None:
+        include_closed = st.checkbox("Показать закрытые месяцы", key="journal_include_closed")
+    
+    try:
+        reports = get_reports(filter_company, include_closed)
+        closed_months = get_closed_months()
+        frozen_results = get_frozen_results(tuple(sorted(closed_months & set(reports.df["month_year"].astype(str)))))
+    except Exception as e:
+        reports, journal_error = None, e
     
-    if reports_df.empty:
+    if reports is None:
+        st.error(f"❌ Не удалось загрузить журнал: {journal_error}")
+    elif reports.empty:
         st.info("Отчётов пока нет.")
     else:
+        st.caption(f"Отчётов: {len(reports)}")
+        
         # Группируем по компаниям
-        for idx, row in reports_df.iterrows():
-            company = row['company_name']
-            facts = json.loads(row['facts_json'])
-            report_id = row['id']
+        for report_idx, row in enumerate(reports.df.itertuples(index=False)):
+            company = row.company_name
+            facts = reports.facts_of(report_idx)
+            report_id = int(row.id)
             
-            # Получаем данные компании для расчёта
-            try:
-                company_row = companies_df[companies_df["name"] == company].iloc[0]
-                N = int(company_row["stations"])
-            except:
-                N = 0
+            if report_id in frozen_results:
+                # Закрытый месяц: итоговый расчёт сохранён при закрытии, не пересчитываем
+                N, K, results = frozen_results[report_id]
+            else:
+                # Получаем данные компании для расчёта
+                try:
+                    company_row = companies_df[companies_df["name"] == company].iloc[0]
+                    N = int(company_row["stations"])
+                except:
+                    N = 0
+                
+                # Сохранённый K (плановое количество выездов)
+                K = int(row.planned_visits)
+                
+                # Пересчитываем детальный расчёт с правильным K
+                results, _, _ = calc_flexible_score_dynamic(N, K, facts)
             
             # Раскрывающийся блок для каждой компании
-            with st.expander(f"🏢 **{company}** — {row['month_percent']}% выполнено | Баллы: {row['total_score']}/{row['max_score']} | Создан: {row['created_at']}", expanded=False):
+            with st.expander(f"🏢 **{company}** — {round(float(row.month_percent), 1)}% выполнено | Баллы: {row.total_score}/{row.max_score} | Создан: {row.created_at}", expanded=False):
                 
                 st.markdown(f"**Всего выездов:** {len(facts)}")
                 st.markdown(f"**Станций по договору:** {N}")
                 
-                # Получаем сохранённый K (плановое количество выездов)
-                K = row.get('planned_visits', 4)  # По умолчанию 4
-                if K is None or K == 0:
-                    K = 4
-                
-                # Пересчитываем детальный расчёт с правильным K
-                results, _, _ = calc_flexible_score_dynamic(N, K, facts)
-                
                 # Показываем детальный расчёт
                 st.markdown("### 📊 Детальный расчёт:")
                 st.dataframe(pd.DataFrame(results), use_container_width=True, hide_index=True)
@@ -771,21 +512,21 @@ with tab_journal:
                 # Таблица с выездами
                 st.markdown("### 📊 Детали по выездам:")
                 
-                # Получаем даты выездов
-                visit_dates_raw = row.get('visit_dates')
-                if visit_dates_raw:
-                    # PostgreSQL JSONB возвращает уже распарсенный объект
-                    if isinstance(visit_dates_raw, str):
-                        try:
-                            visit_dates = json.loads(visit_dates_raw)
-                        except:
-                            visit_dates = []
-                    elif isinstance(visit_dates_raw, list):
-                        visit_dates = visit_dates_raw
-                    else:
-                        visit_dates = []
-                else:
-                    visit_dates = []
+                # Даты выездов (разобраны при загрузке журнала)
+                visit_dates = reports.dates_of(report_idx)
+                
+                if row.month_year in closed_months:
+                    # Закрытый месяц — только просмотр
+                    st.dataframe(pd.DataFrame({
+                        "№": [f"Выезд {i+1}" for i in range(len(facts))],
+                        "Проверено станций": facts,
+                        "Дата добавления": [
+                            visit_dates[i].strftime("%d.%m.%Y %H:%M") if i < len(visit_dates) and not pd.isna(visit_dates[i]) else "Не указана"
+                            for i in range(len(facts))
+                        ],
+                    }), use_container_width=True, hide_index=True)
+                    st.caption(f"🔒 Месяц {row.month_year} закрыт — отчёт доступен только для чтения")
+                    continue
                 
                 # Редактируемые поля для каждого выезда
                 edited_facts = []
@@ -809,13 +550,8 @@ with tab_journal:
                     edited_facts.append(new_value)
                     
                     # Показываем дату
-                    if i < len(visit_dates):
-                        from datetime import datetime
-                        try:
-                            dt = datetime.fromisoformat(visit_dates[i])
-                            date_str = dt.strftime("%d.%m.%Y %H:%M")
-                        except:
-                            date_str = "Не указана"
+                    if i < len(visit_dates) and not pd.isna(visit_dates[i]):
+                        date_str = visit_dates[i].strftime("%d.%m.%Y %H:%M")
                     else:
                         date_str = "Не указана"
                     
@@ -830,7 +566,7 @@ with tab_journal:
                         
                         if len(facts) == 0:
                             # Если это последний выезд — удаляем весь отчёт
-                            delete_report(report_id)
+                            delete_report(report_id, row.month_year)
                             st.success("Отчёт полностью удалён")
                             st.rerun()
                         else:
@@ -845,9 +581,10 @@ with tab_journal:
                                 SET facts_json = %s, total_score = %s, max_score = %s, 
                                     month_percent = %s, visit_dates = %s, created_at = NOW()
                                 WHERE id = %s
-                            """, (json.dumps(facts, ensure_ascii=False), total_score_new, max_score_new, month_percent_new, json.dumps(visit_dates), report_id))
+                            """, (json.dumps(facts, ensure_ascii=False), total_score_new, max_score_new, month_percent_new, json.dumps([None if pd.isna(d) else d.isoformat() for d in visit_dates]), report_id))
                             
                             conn.commit()
+                            mark_primary_write(row.month_year)
                             cur.close()
                             conn.close()
                             
@@ -874,6 +611,7 @@ with tab_journal:
                             """, (json.dumps(edited_facts, ensure_ascii=False), total_score, max_score, month_percent, report_id))
                             
                             conn.commit()
+                            mark_primary_write(row.month_year)
                             cur.close()
                             conn.close()
                             
@@ -884,8 +622,51 @@ with tab_journal:
                 
                 with col2:
                     if st.button("🗑 Удалить отчёт", key=f"del_{report_id}"):
-                        delete_report(report_id)
+                        delete_report(report_id, row.month_year)
                         st.success(f"Удалён отчёт ID={report_id}")
                         st.rerun()
 
+with tab_trends:
+    st.subheader("📈 Динамика по месяцам")
+
+    try:
+        companies_df = load_companies_from_gsheet()
+        trend_company = company_picker("Компания для трендов", companies_df, key="trends_company", extra_options=["Все компании"])
+        trend_company = None if trend_company == "Все компании" else trend_company
+    except:
+        trend_company = None
+    
+    trend_months = st.slider("Месяцев", min_value=3, max_value=36, value=12, key="trends_months")
+    try:
+        trends_df = get_trends(trend_company, trend_months)
+    except Exception as e:
+        trends_df, trends_error = None, e
+    
+    if trends_df is None:
+        st.error(f"❌ Не удалось загрузить динамику: {trends_error}")
+    elif trends_df.empty:
+        st.info("Нет данных за выбранный период.")
+    else:
+        last = trends_df.iloc[-1]
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Выполнено", f"{last['month_percent']}%",
+                  None if pd.isna(last["percent_change"]) else f"{last['percent_change']:+.1f}%")
+        c2.metric("Баллы / максимум", f"{last['score_ratio']:.0%}",
+                  None if pd.isna(last["score_ratio_change"]) else f"{last['score_ratio_change'] * 100:+.1f} п.п.")
+        c3.metric("Станций за выезд", f"{last['avg_stations']}")
+        
+        chart = trends_df.set_index("month_year")
+        st.line_chart(chart[["month_percent", "percent_avg_3m"]])
+        st.line_chart(chart[["avg_stations"]])
+        st.dataframe(trends_df.rename(columns={
+            "month_year": "Месяц",
+            "companies": "Компаний",
+            "month_percent": "Выполнено, %",
+            "percent_change": "Δ к прошлому, %",
+            "percent_avg_3m": "Среднее за 3 мес., %",
+            "score_ratio": "Баллы / макс.",
+            "score_ratio_change": "Δ баллов",
+            "avg_stations": "Станций за выезд",
+        }), use_container_width=True, hide_index=True)
+
 st.caption("🔗 Данные обновляются из Google Sheets каждые 5 минут - НЕ ГУБИ СВОЙ КПИ !")
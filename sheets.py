@@ -0,0 +1,42 @@
+import streamlit as st
+import pandas as pd
+
+
+# ---------------------- КОНФИГУРАЦИЯ ---------------------- #
+SPREADSHEET_ID = "1048LAnXOi822I87iLgommj-181thuzktnvdhQmzUfho"
+SHEET_NAME = "Клиенты"
+
+
+# ---------------------- GOOGLE SHEETS ---------------------- #
+
+@st.cache_data(ttl=300)
+def load_companies_from_gsheet():
+    # Клиенты Google импортируются только при реальной загрузке, не при каждом старте
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    
+    if "gcp_service_account" in st.secrets:
+        creds_dict = dict(st.secrets["gcp_service_account"])
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+    else:
+        creds = ServiceAccountCredentials.from_json_keyfile_name("service_account.json", scope)
+    
+    client = gspread.authorize(creds)
+    sheet = client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME)
+    data = sheet.get_all_values()
+    headers = data[0]
+    rows = data[1:]
+    df = pd.DataFrame(rows, columns=headers)
+    df = df[["Организация", "Количество раб.мест без серверов и доп.сервисов (обслуживаемых)"]]
+    df = df.rename(columns={
+        "Организация": "name",
+        "Количество раб.мест без серверов и доп.сервисов (обслуживаемых)": "stations"
+    })
+    df = df[df["name"].str.strip() != ""]
+    df["stations"] = pd.to_numeric(df["stations"], errors="coerce").fillna(0).astype(int)
+    df = df[["name", "stations"]]
+    # Отпечаток снимка: по нему пересобирается индекс поиска компаний
+    df.attrs["snapshot"] = int(pd.util.hash_pandas_object(df["name"], index=False).sum())
+    return df
@@ -0,0 +1,57 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Тесты с PostgreSQL пропускаются, если сервер недоступен
+TEST_DATABASE_URL = os.environ.get(
+    "TEST_DATABASE_URL", "host=localhost dbname=postgres user=postgres password=postgres connect_timeout=3"
+)
+
+
+@pytest.fixture
+def pg():
+    """Соединение с PostgreSQL в отдельной временной схеме (удаляется после теста)"""
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        conn = psycopg2.connect(TEST_DATABASE_URL)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    schema = "test_" + uuid.uuid4().hex[:12]
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    cur.close()
+    yield conn
+    conn.rollback()
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def legacy_reports(pg):
+    """reports в исходном виде (до reports_maintenance.py migrate): обычная таблица с SERIAL id"""
+    cur = pg.cursor()
+    cur.execute("""
+        CREATE TABLE reports (
+            id SERIAL PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT NOW(),
+            company_name TEXT,
+            month_year TEXT,
+            facts_json TEXT,
+            total_score INTEGER,
+            max_score INTEGER,
+            month_percent REAL,
+            visit_dates JSONB,
+            planned_visits INTEGER DEFAULT 4
+        )
+    """)
+    pg.commit()
+    cur.close()
+    return pg
@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import sheets
+import visit_queue
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service_score_app.py")
+NAMES = ["ООО «Альфа»", "Бета", "Гамма"] + [f"Компания {i}" for i in range(100)]
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """Приложение с тестовыми компаниями; БД не нужна — выбор компании от неё не зависит"""
+    df = pd.DataFrame({"name": NAMES, "stations": [10] * len(NAMES)})
+    df.attrs["snapshot"] = int(pd.util.hash_pandas_object(df["name"], index=False).sum())
+    monkeypatch.setattr(sheets, "load_companies_from_gsheet", lambda: df.copy())
+    monkeypatch.setattr(visit_queue, "QUEUE_PATH", str(tmp_path / "queue.sqlite3"))
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    return at
+
+
+def _search(at, key, query):
+    at.text_input(key=f"{key}_search").input(query).run()
+    return at.selectbox(key=key)
+
+
+def test_search_selects_top_hit(app):
+    assert _search(app, "journal_filter", "альфа").value == "ООО «Альфа»"
+    # Новый запрос переключает на лучшее совпадение, а не на «Все компании»
+    picker = _search(app, "journal_filter", "бета")
+    assert picker.value == "Бета"
+    assert "Все компании" not in picker.options
+
+
+def test_default_list_is_capped_and_keeps_selection(app):
+    default = len(app.selectbox(key="company").options)
+    assert 0 < default < len(NAMES)
+    assert app.selectbox(key="trends_company").options == ["Все компании"] + NAMES[:default]
+
+    assert _search(app, "company", "компания 99").value == "Компания 99"
+    # После очистки запроса выбранная компания остаётся в списке и выбранной
+    picker = _search(app, "company", "")
+    assert picker.value == "Компания 99"
+    assert picker.options == ["Компания 99"] + NAMES[:default]
+
+
+def test_typo_without_exact_match(app):
+    assert _search(app, "company", "гама").value == "Гамма"
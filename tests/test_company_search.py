@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+import pytest
+
+from company_search import CompanyIndex, normalize_name
+
+NAMES = ["ООО «Ромашка»", "Газпромнефть Сервис", "ИП Иванов", "Сервис Плюс", "Автосервис", "Ёлка"]
+
+
+@pytest.fixture
+def index():
+    return CompanyIndex(NAMES)
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Ёлка", "елка"),
+    ("ООО «Ромашка»", "ромашка"),
+    ("ЗАО Газпромнефть-Сервис, ООО", "газпромнефть сервис"),
+    ('ИП "Иванов И.И."', "иванов и и"),
+    ("LLC Acme Inc.", "acme"),
+])
+def test_normalize_name(name, expected):
+    assert normalize_name(name) == expected
+
+
+def test_typo_tolerance(index):
+    assert index.search("ромошка")[0] == "ООО «Ромашка»"
+
+
+def test_yo_and_legal_form_do_not_matter(index):
+    assert index.search("елка")[0] == "Ёлка"
+    assert index.search("иванов ип")[0] == "ИП Иванов"
+
+
+def test_name_prefix_ranks_before_word_prefix_and_substring(index):
+    # «Сервис Плюс» начинается с запроса, у «Газпромнефть Сервис» с него начинается слово,
+    # в «Автосервис» он только внутри
+    assert index.search("серв") == ["Сервис Плюс", "Газпромнефть Сервис", "Автосервис"]
+
+
+def test_limit(index):
+    assert index.search("серв", limit=2) == ["Сервис Плюс", "Газпромнефть Сервис"]
+
+
+@pytest.mark.parametrize("query", ["", "   ", "«»!", "ООО", "ип, зао"])
+def test_empty_queries_find_nothing(index, query):
+    assert index.search(query) == []
+
+
+def test_no_match(index):
+    assert index.search("xyz") == []
+    assert CompanyIndex([]).search("ромашка") == []
+
+
+def test_search_is_fast_on_large_directory():
+    """Бюджет поиска по мере ввода: замер ~0.3 мс (медиана) на 40 тыс. названий"""
+    rnd = random.Random(1)
+    words = ["Газ", "Нефть", "Сервис", "Строй", "Торг", "Урал", "Сибирь", "Транс", "Авто", "Мир", "Тех", "Пром"]
+    names = [f"ООО «{rnd.choice(words)}{rnd.choice(words).lower()} {rnd.choice(words)} {i}»" for i in range(40_000)]
+    big = CompanyIndex(names)
+
+    timings = []
+    for query in ["газнефть", "строй 123", "урал", "сервис торг 9", "тронс"] * 10:
+        started = time.perf_counter()
+        big.search(query)
+        timings.append(time.perf_counter() - started)
+
+    assert statistics.median(timings) < 0.005
@@ -0,0 +1,192 @@
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+from psycopg2.extensions import parse_dsn
+
+import db
+from conftest import TEST_DATABASE_URL
+
+
+def _section(dsn):
+    params = parse_dsn(dsn)
+    return {"host": params.get("host", "localhost"), "port": int(params.get("port", 5432)),
+            "database": params["dbname"], "user": params["user"], "password": params.get("password", "")}
+
+
+@pytest.fixture
+def fake_st(monkeypatch):
+    """st.secrets и st.session_state одной сессии; состояние реплики и основной БД — с нуля"""
+    fake = SimpleNamespace(secrets={}, session_state={})
+    monkeypatch.setattr(db, "st", fake)
+    for name in ("_primary_down_until", "_replica_down_until", "_replica_lag_ok_until"):
+        monkeypatch.setattr(db, name, 0.0)
+    return fake
+
+
+def test_replica_read_gets_caller_timeout(pg, fake_st):
+    """Реплика — тот же локальный сервер (не в recovery, отставание 0)"""
+    fake_st.secrets = {"postgres": _section(TEST_DATABASE_URL), "postgres_replica": _section(TEST_DATABASE_URL)}
+
+    conn = db.get_db_connection(readonly=True, timeout=2)
+    try:
+        cur = conn.cursor()
+        cur.execute("SHOW statement_timeout")
+        assert cur.fetchone()[0] == "2s"
+        with pytest.raises(psycopg2.errors.ReadOnlySqlTransaction):
+            cur.execute("CREATE TEMP TABLE t (x int)")
+    finally:
+        conn.close()
+
+
+class Server:
+    def __init__(self):
+        self.down = False
+        self.lag = 0
+        self.connects = []
+        self.lag_checks = 0
+
+
+class StubCursor:
+    def __init__(self, server):
+        self.server = server
+
+    def execute(self, query, params=None):
+        self.server.lag_checks += 1
+
+    def fetchone(self):
+        return (self.server.lag,)
+
+    def close(self):
+        pass
+
+
+class StubConnection:
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.readonly = False
+
+    def set_session(self, readonly=False, autocommit=False):
+        self.readonly = readonly
+
+    def cursor(self):
+        return StubCursor(self.server)
+
+    def close(self):
+        self.closed = True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def servers(fake_st, monkeypatch):
+    """Основная БД и реплика — заглушки psycopg2.connect; время — управляемые часы"""
+    servers = {"primary": Server(), "replica": Server()}
+    section = {"database": "journal", "user": "app", "password": "secret", "port": 5432}
+    fake_st.secrets = {"postgres": dict(section, host="primary"), "postgres_replica": dict(section, host="replica")}
+
+    def connect(**kwargs):
+        server = servers[kwargs["host"]]
+        server.connects.append(kwargs)
+        if server.down:
+            raise psycopg2.OperationalError(f"{kwargs['host']} недоступна")
+        return StubConnection(server)
+
+    clock = Clock()
+    monkeypatch.setattr(psycopg2, "connect", connect)
+    monkeypatch.setattr(db, "time", SimpleNamespace(monotonic=clock, time=clock))
+    servers["clock"] = clock
+    return servers
+
+
+def test_reads_go_to_replica_and_writes_to_primary(servers):
+    read = db.get_db_connection(readonly=True)
+    write = db.get_db_connection()
+
+    assert read.server is servers["replica"] and read.readonly
+    assert write.server is servers["primary"]
+
+
+def test_pinned_session_reads_from_primary(servers, fake_st):
+    assert db.read_cache_key() == (True, 0)
+
+    db.pin_reads_to_primary()
+    pinned_until = fake_st.session_state["primary_pinned_until"]
+
+    assert db.get_db_connection(readonly=True).server is servers["primary"]
+    assert db.read_cache_key() == (False, 0)
+
+    servers["clock"].now += db.PRIMARY_STICKY_SECONDS + 1
+    assert db.get_db_connection(readonly=True).server is servers["replica"]
+    # Кэш после закрепления — с новым ключом: снимок до записи сессии не вернётся
+    assert db.read_cache_key() == (True, pinned_until)
+
+
+def test_unreachable_replica_is_skipped_for_retry_window(servers):
+    servers["replica"].down = True
+
+    assert db.get_db_connection(readonly=True).server is servers["primary"]
+    servers["replica"].down = False
+    servers["clock"].now += db.REPLICA_RETRY_SECONDS - 1
+    assert db.get_db_connection(readonly=True).server is servers["primary"]
+    assert len(servers["replica"].connects) == 1
+
+    servers["clock"].now += 2
+    assert db.get_db_connection(readonly=True).server is servers["replica"]
+
+
+def test_lagging_replica_falls_back_and_is_skipped(servers):
+    servers["replica"].lag = db.REPLICA_MAX_LAG + 5
+
+    assert db.get_db_connection(readonly=True).server is servers["primary"]
+    servers["replica"].lag = 0
+    servers["clock"].now += db.REPLICA_RETRY_SECONDS - 1
+    assert db.get_db_connection(readonly=True).server is servers["primary"]
+    assert len(servers["replica"].connects) == 1
+
+    servers["clock"].now += 2
+    assert db.get_db_connection(readonly=True).server is servers["replica"]
+
+
+def test_lag_is_not_rechecked_while_it_cannot_exceed_limit(servers):
+    servers["replica"].lag = 2
+
+    db.get_db_connection(readonly=True)
+    servers["clock"].now += db.REPLICA_MAX_LAG - 2 - 0.5
+    db.get_db_connection(readonly=True)
+    assert servers["replica"].lag_checks == 1
+
+    servers["clock"].now += 1
+    db.get_db_connection(readonly=True)
+    assert servers["replica"].lag_checks == 2
+
+
+def test_timeouts_reach_both_servers(servers):
+    db.get_db_connection(readonly=True, timeout=2)
+    db.get_db_connection(timeout=2)
+
+    for name in ("replica", "primary"):
+        kwargs = servers[name].connects[-1]
+        assert kwargs["connect_timeout"] == 2
+        assert kwargs["options"] == "-c statement_timeout=2000"
+
+
+def test_unreachable_primary_fails_fast_for_timed_reads(servers):
+    servers["primary"].down = True
+
+    with pytest.raises(psycopg2.OperationalError):
+        db.get_db_connection(timeout=2)
+    with pytest.raises(db.DatabaseUnavailable):
+        db.get_db_connection(timeout=2)
+    assert len(servers["primary"].connects) == 1
+
+    servers["primary"].down = False
+    servers["clock"].now += db.PRIMARY_RETRY_SECONDS + 1
+    assert db.get_db_connection(timeout=2).server is servers["primary"]
@@ -0,0 +1,121 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from psycopg2.pool import ThreadedConnectionPool
+
+import ingest_api
+import reports_maintenance
+from conftest import TEST_DATABASE_URL
+from scoring import calc_flexible_score_dynamic
+
+
+@pytest.fixture
+def companies_csv(tmp_path):
+    path = tmp_path / "companies.csv"
+    path.write_text("name,stations\nАльфа,100\nБета,50\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def search_path(pg):
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    reports_maintenance.ensure_partitions(pg)
+    cur.execute("SHOW search_path")
+    (path,) = cur.fetchone()
+    cur.close()
+    return path
+
+
+def _requests(app, search_path, requests, before=None):
+    """Запросы к приложению по очереди; пул соединений — в схеме теста.
+
+    before(app) вызывается после запуска приложения, до первого запроса.
+    """
+    async def db_pool(app):
+        app["pool"] = ThreadedConnectionPool(1, 4, TEST_DATABASE_URL, options=f"-c search_path={search_path}")
+        app["executor"] = ThreadPoolExecutor(max_workers=4)
+        yield
+        app["executor"].shutdown(wait=True)
+        app["pool"].closeall()
+
+    async def run():
+        app.cleanup_ctx.clear()
+        app.cleanup_ctx.append(db_pool)
+        async with TestClient(TestServer(app)) as client:
+            if before is not None:
+                before(app)
+            responses = []
+            for method, url, kwargs in requests:
+                response = await client.request(method, url, **kwargs)
+                responses.append((response.status, await response.json()))
+            return responses
+
+    return asyncio.run(run())
+
+
+def _request(app, search_path, method, url, **kwargs):
+    """Один запрос к приложению"""
+    return _requests(app, search_path, [(method, url, kwargs)])[0]
+
+
+def test_stations_come_from_company_directory(companies_csv, search_path):
+    app = ingest_api.create_app(companies_csv)
+    visit = {"company_name": "Бета", "stations_checked": 30, "planned_visits": 4, "stations_total": 1}
+
+    status, body = _request(app, search_path, "POST", "/visits", json=visit)
+
+    assert status == 201
+    # stations_total клиента не используется: N = 50 из справочника
+    assert body["results"] == calc_flexible_score_dynamic(50, 4, [30])[0]
+
+
+def test_unknown_company_is_rejected(companies_csv, search_path, pg):
+    app = ingest_api.create_app(companies_csv)
+    visits = [{"company_name": "Альфа", "stations_checked": 5, "planned_visits": 4},
+              {"company_name": "Гамма", "stations_checked": 5, "planned_visits": 4}]
+
+    status, body = _request(app, search_path, "POST", "/visits/bulk", json={"visits": visits})
+
+    assert status == 400
+    assert "Гамма" in body["error"]
+    cur = pg.cursor()
+    cur.execute("SELECT COUNT(*) FROM reports")
+    assert cur.fetchone()[0] == 0
+
+
+def test_company_sheet_unavailable(search_path, monkeypatch):
+    def load_companies_from_gsheet():
+        raise FileNotFoundError("service_account.json")
+
+    monkeypatch.setattr(ingest_api, "load_companies_from_gsheet", load_companies_from_gsheet)
+    app = ingest_api.create_app()
+    visit = {"company_name": "Альфа", "stations_checked": 5, "planned_visits": 4}
+
+    status, body = _request(app, search_path, "POST", "/visits", json=visit)
+
+    assert status == 503
+
+
+def test_dead_pooled_connection_gives_503_and_is_replaced(companies_csv, search_path, pg):
+    app = ingest_api.create_app(companies_csv)
+    visit = {"company_name": "Альфа", "stations_checked": 5, "planned_visits": 4}
+
+    def restart_database(app):
+        # Перезапуск БД: соединение, ждущее в пуле, оборвано сервером
+        conn = app["pool"].getconn()
+        pid = conn.get_backend_pid()
+        app["pool"].putconn(conn)
+        cur = pg.cursor()
+        cur.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        cur.close()
+
+    (status, body), (retry_status, _) = _requests(
+        app, search_path, [("POST", "/visits", {"json": visit})] * 2, before=restart_database)
+
+    assert status == 503
+    assert "error" in body
+    # Оборванное соединение не вернулось в пул: повтор проходит на новом
+    assert retry_status == 201
@@ -0,0 +1,166 @@
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import reports_maintenance
+from journal import ReportsFrame, fetch_closed_months, fetch_month_results, fetch_reports
+from visits import apply_visit
+
+CURRENT_MONTH = datetime.now().strftime("%Y-%m")
+
+
+@pytest.fixture
+def reports_db(pg):
+    """Партиционированная reports: 2025-01 закрыт и в архиве, 2025-02 и текущий месяц открыты"""
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    for month_year in ("2025-01", "2025-02", CURRENT_MONTH):
+        reports_maintenance.ensure_partition(cur, month_year)
+    pg.commit()
+
+    visits = [
+        ("Альфа", "2025-01", 10, "2025-01-10T09:00:00"),
+        ("Альфа", "2025-01", 12, "2025-01-20T09:00:00"),
+        ("Бета", "2025-01", 7, "2025-01-11T09:00:00"),
+        ("Альфа", "2025-02", 9, "2025-02-10T09:00:00"),
+        ("Альфа", CURRENT_MONTH, 5, CURRENT_MONTH + "-01T09:00:00"),
+        ("Бета", CURRENT_MONTH, 6, CURRENT_MONTH + "-01T10:00:00"),
+    ]
+    for company_name, month_year, stations, visit_date in visits:
+        apply_visit(cur, company_name, month_year, stations, 4, 100, visit_date)
+        pg.commit()
+
+    reports_maintenance.freeze_month(pg, "2025-01")
+    reports_maintenance.archive_month(pg, "2025-01")
+    cur.close()
+    return pg
+
+
+def _by_month(rows):
+    """{(компания, месяц): (станции, даты выездов)}"""
+    return {
+        (company_name, month_year): (json.loads(facts_json), visit_dates)
+        for _, _, company_name, month_year, facts_json, _, _, _, visit_dates, _ in rows
+    }
+
+
+def test_company_history_includes_archive(reports_db):
+    rows = fetch_reports(reports_db.cursor(), "Альфа")
+
+    assert _by_month(rows) == {
+        ("Альфа", "2025-01"): ([10, 12], ["2025-01-10T09:00:00", "2025-01-20T09:00:00"]),
+        ("Альфа", "2025-02"): ([9], ["2025-02-10T09:00:00"]),
+        ("Альфа", CURRENT_MONTH): ([5], [CURRENT_MONTH + "-01T09:00:00"]),
+    }
+    created = [row[1] for row in rows]
+    assert created == sorted(created, reverse=True)
+
+
+def test_all_months_include_archive(reports_db):
+    rows = fetch_reports(reports_db.cursor(), include_closed=True)
+
+    assert set(_by_month(rows)) == {
+        ("Альфа", "2025-01"), ("Бета", "2025-01"), ("Альфа", "2025-02"),
+        ("Альфа", CURRENT_MONTH), ("Бета", CURRENT_MONTH),
+    }
+
+
+def test_open_months_skip_closed(reports_db):
+    rows = fetch_reports(reports_db.cursor())
+
+    assert set(_by_month(rows)) == {("Альфа", "2025-02"), ("Альфа", CURRENT_MONTH), ("Бета", CURRENT_MONTH)}
+
+
+def test_open_months_older_than_closed_stay_visible(reports_db):
+    cur = reports_db.cursor()
+    reports_maintenance.ensure_partition(cur, "2024-12")
+    apply_visit(cur, "Альфа", "2024-12", 8, 4, 100, "2024-12-10T09:00:00")
+    reports_db.commit()
+
+    rows = fetch_reports(cur)
+
+    assert ("Альфа", "2024-12") in _by_month(rows)
+    assert ("Альфа", "2025-01") not in _by_month(rows)
+
+
+def test_open_months_prune_closed_partitions(reports_db):
+    reports_maintenance.freeze_month(reports_db, "2025-02")
+    cur = reports_db.cursor()
+    closed = sorted(fetch_closed_months(cur))
+    cur.execute("EXPLAIN SELECT * FROM reports WHERE month_year <> ALL(%s::text[])", (closed,))
+    plan = "\n".join(r[0] for r in cur.fetchall())
+
+    assert "reports_2025_02" not in plan
+    assert reports_maintenance.partition_name(CURRENT_MONTH) in plan
+    assert set(_by_month(fetch_reports(cur))) == {("Альфа", CURRENT_MONTH), ("Бета", CURRENT_MONTH)}
+
+
+def test_journal_works_before_migration(legacy_reports):
+    """Таблица reports до reports_maintenance.py migrate: нет closed_months, reports_archive, month_results"""
+    pg = legacy_reports
+    cur = pg.cursor()
+    apply_visit(cur, "Альфа", CURRENT_MONTH, 5, 4, 100, CURRENT_MONTH + "-01T09:00:00")
+    apply_visit(cur, "Бета", "2025-01", 7, 4, 100, "2025-01-11T09:00:00")
+    pg.commit()
+
+    assert fetch_closed_months(cur) == set()
+    assert fetch_month_results(cur, ["2025-01"]) == {}
+    assert set(_by_month(fetch_reports(cur, "Альфа"))) == {("Альфа", CURRENT_MONTH)}
+    assert set(_by_month(fetch_reports(cur, include_closed=True))) == {("Альфа", CURRENT_MONTH), ("Бета", "2025-01")}
+    assert set(_by_month(fetch_reports(cur))) == {("Альфа", CURRENT_MONTH), ("Бета", "2025-01")}
+
+
+def _row(report_id, company_name, facts_json, visit_dates, total_score=None, max_score=None, month_percent=None, planned_visits=None):
+    return (report_id, datetime(2025, 1, report_id), company_name, "2025-01", facts_json,
+            total_score, max_score, month_percent, visit_dates, planned_visits)
+
+
+def test_reports_frame_offsets():
+    reports = ReportsFrame([
+        _row(1, "Альфа", "[10, 12]", ["2025-01-10T09:00:00", "2025-01-20T09:00:00"]),
+        _row(2, "Бета", "[]", []),
+        _row(3, "Альфа", [7], '["2025-01-11T09:00:00"]'),
+    ])
+
+    assert len(reports) == 3
+    assert [reports.facts_of(i) for i in range(3)] == [[10, 12], [], [7]]
+    assert [reports.dates_of(i) for i in range(3)] == [
+        [pd.Timestamp("2025-01-10T09:00:00"), pd.Timestamp("2025-01-20T09:00:00")],
+        [],
+        [pd.Timestamp("2025-01-11T09:00:00")],
+    ]
+    assert list(reports.df["company_name"]) == ["Альфа", "Бета", "Альфа"]
+
+
+def test_reports_frame_defaults():
+    reports = ReportsFrame([_row(1, "Альфа", "[5]", None)])
+
+    row = reports.df.iloc[0]
+    assert (row.total_score, row.max_score, row.month_percent, row.planned_visits) == (0, 0, 0, 4)
+    assert reports.dates_of(0) == []
+    assert ReportsFrame().empty
+
+
+def test_reports_frame_bad_dates_are_nat():
+    reports = ReportsFrame([
+        _row(1, "Альфа", "[5, 6, 7]", ["не дата", None, "2025-01-10T09:00:00"]),
+        _row(2, "Бета", "[1]", "не JSON"),
+    ])
+
+    dates = reports.dates_of(0)
+    assert pd.isna(dates[0]) and pd.isna(dates[1])
+    assert dates[2] == pd.Timestamp("2025-01-10T09:00:00")
+    assert reports.dates_of(1) == []
+
+
+def test_reports_frame_mixed_timezones():
+    """Одна дата с часовым поясом не ломает журнал: берётся её местное время"""
+    reports = ReportsFrame([
+        _row(1, "Альфа", "[5]", ["2025-01-10T09:00:00"]),
+        _row(2, "Бета", "[6, 7]", ["2025-01-11T09:00:00+03:00", "2025-01-12T10:30:00Z"]),
+    ])
+
+    assert reports.dates_of(0) == [pd.Timestamp("2025-01-10T09:00:00")]
+    assert reports.dates_of(1) == [pd.Timestamp("2025-01-11T09:00:00"), pd.Timestamp("2025-01-12T10:30:00")]
@@ -0,0 +1,220 @@
+import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+import pytest
+
+import reports_maintenance
+from conftest import TEST_DATABASE_URL
+from visits import apply_visit
+
+LEGACY_ROWS = [
+    ("Альфа", "2025-01", [10, 12]),
+    ("Бета", "2025-01", [7]),
+    ("Альфа", "2025-02", [9]),
+]
+
+
+@pytest.fixture
+def legacy_db(legacy_reports):
+    """reports до migrate с отчётами LEGACY_ROWS"""
+    pg = legacy_reports
+    cur = pg.cursor()
+    for company_name, month_year, facts in LEGACY_ROWS:
+        cur.execute(
+            "INSERT INTO reports (company_name, month_year, facts_json) VALUES (%s, %s, %s)",
+            (company_name, month_year, json.dumps(facts)),
+        )
+    pg.commit()
+    cur.close()
+    return pg
+
+
+@pytest.mark.parametrize("command", ["close_month", "freeze_month", "archive_month"])
+def test_closing_requires_migration(legacy_db, command):
+    with pytest.raises(RuntimeError, match="migrate"):
+        getattr(reports_maintenance, command)(legacy_db, "2025-01")
+    assert reports_maintenance._table_kind(legacy_db.cursor(), "reports") == "r"
+
+
+@pytest.fixture
+def reader(pg):
+    """Второе соединение в той же схеме — открытая читающая транзакция на reports"""
+    cur = pg.cursor()
+    cur.execute("SHOW search_path")
+    (search_path,) = cur.fetchone()
+    cur.close()
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.cursor().execute(f"SET search_path TO {search_path}")
+    conn.commit()
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+def _start_reading(reader):
+    reader.cursor().execute("SELECT COUNT(*) FROM reports")
+
+
+def _assert_migrated(pg):
+    cur = pg.cursor()
+    assert reports_maintenance._table_kind(cur, "reports") == "p"
+    assert reports_maintenance._table_kind(cur, "reports_legacy") == "r"
+    cur.execute("SELECT company_name, month_year, facts_json FROM reports ORDER BY id")
+    assert [(c, m, json.loads(f)) for c, m, f in cur.fetchall()] == LEGACY_ROWS
+    # Новые отчёты получают id после перенесённых
+    apply_visit(cur, "Гамма", "2025-02", 5, 4, 100, "2025-02-11T09:00:00")
+    cur.execute("SELECT id FROM reports WHERE company_name = 'Гамма'")
+    assert cur.fetchone()[0] > len(LEGACY_ROWS)
+    pg.rollback()
+
+
+def test_migrate_legacy_table(legacy_db):
+    reports_maintenance.migrate(legacy_db)
+
+    _assert_migrated(legacy_db)
+
+
+def test_swap_retries_while_readers_hold_the_table(legacy_db, reader, monkeypatch):
+    monkeypatch.setattr(reports_maintenance, "SWAP_LOCK_TIMEOUT", "100ms")
+    sleeps = []
+
+    def sleep(seconds):
+        # Читатель завершает транзакцию, пока миграция ждёт повтора
+        sleeps.append(seconds)
+        reader.commit()
+
+    monkeypatch.setattr(reports_maintenance.time, "sleep", sleep)
+    _start_reading(reader)
+
+    reports_maintenance.migrate(legacy_db)
+
+    assert len(sleeps) == 1
+    _assert_migrated(legacy_db)
+
+
+def test_swap_gives_up_and_can_be_rerun(legacy_db, reader, monkeypatch):
+    monkeypatch.setattr(reports_maintenance, "SWAP_LOCK_TIMEOUT", "100ms")
+    monkeypatch.setattr(reports_maintenance, "SWAP_LOCK_ATTEMPTS", 2)
+    monkeypatch.setattr(reports_maintenance.time, "sleep", lambda seconds: None)
+    _start_reading(reader)
+
+    with pytest.raises(RuntimeError):
+        reports_maintenance.migrate(legacy_db)
+    assert reports_maintenance._table_kind(legacy_db.cursor(), "reports") == "r"
+
+    reader.commit()
+    reports_maintenance.migrate(legacy_db)
+    _assert_migrated(legacy_db)
+
+
+@pytest.fixture
+def closing_db(pg, monkeypatch):
+    """Партиционированная reports с отчётами за 2025-01, N компаний — из «таблицы»"""
+    import pandas as pd
+
+    monkeypatch.setattr(reports_maintenance, "load_companies_from_gsheet",
+                        lambda: pd.DataFrame({"name": ["Альфа", "Бета"], "stations": [100, 50]}))
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    reports_maintenance.ensure_partition(cur, "2025-01")
+    apply_visit(cur, "Альфа", "2025-01", 10, 4, 100, "2025-01-10T09:00:00")
+    apply_visit(cur, "Альфа", "2025-01", 12, 4, 100, "2025-01-20T09:00:00")
+    apply_visit(cur, "Бета", "2025-01", 7, 4, 50, "2025-01-11T09:00:00")
+    pg.commit()
+    cur.close()
+    return pg
+
+
+def _month_results(pg):
+    cur = pg.cursor()
+    cur.execute("SELECT company_name, stations, total_score, max_score FROM month_results ORDER BY company_name")
+    return cur.fetchall()
+
+
+@pytest.mark.parametrize("archived", [False, True])
+def test_close_finishes_frozen_month(closing_db, tmp_path, archived):
+    reports_maintenance.close_month(closing_db, "2025-01", str(tmp_path / "expected"), workers=1)
+    expected = _month_results(closing_db)
+    closing_db.cursor().execute("DROP TABLE month_results")
+    closing_db.commit()
+    # Месяц заморожен в обход close (старый freeze): итогов нет
+    reports_maintenance.freeze_month(closing_db, "2025-01")
+    if archived:
+        reports_maintenance.archive_month(closing_db, "2025-01")
+
+    reports_maintenance.close_month(closing_db, "2025-01", str(tmp_path / "cards"), workers=1)
+
+    assert _month_results(closing_db) == expected
+    assert sorted(p.name for p in (tmp_path / "cards").iterdir() if p.suffix == ".csv") == [
+        "2025-01_Альфа.csv", "2025-01_Бета.csv"]
+
+
+def test_close_is_idempotent(closing_db, tmp_path, capsys):
+    reports_maintenance.close_month(closing_db, "2025-01", str(tmp_path), workers=1)
+    results = _month_results(closing_db)
+
+    reports_maintenance.close_month(closing_db, "2025-01", str(tmp_path), workers=1)
+
+    assert "уже закрыт" in capsys.readouterr().out
+    assert _month_results(closing_db) == results
+    assert [r[0] for r in results] == ["Альфа", "Бета"]
+
+
+def _search_path(pg):
+    cur = pg.cursor()
+    cur.execute("SHOW search_path")
+    (search_path,) = cur.fetchone()
+    cur.close()
+    return search_path
+
+
+def test_close_blocks_writes_while_scoring(closing_db, tmp_path, monkeypatch):
+    writer = psycopg2.connect(TEST_DATABASE_URL, options=f"-c search_path={_search_path(closing_db)}")
+    writer_pid = writer.get_backend_pid()
+    outcome = []
+
+    def late_visit():
+        # Запоздавший выезд из очереди за закрываемый месяц
+        cur = writer.cursor()
+        try:
+            apply_visit(cur, "Альфа", "2025-01", 40, 4, 100, "2025-01-31T23:00:00")
+            writer.commit()
+            outcome.append("записан")
+        except psycopg2.Error as e:
+            writer.rollback()
+            outcome.append(str(e))
+
+    thread = threading.Thread(target=late_visit)
+
+    class WriteDuringScoring(ProcessPoolExecutor):
+        def map(self, *args, **kwargs):
+            if not thread.is_alive() and not outcome:
+                thread.start()
+                # Ждём, пока выезд встанет в очередь за блокировкой (или, без неё, запишется)
+                cur = closing_db.cursor()
+                deadline = time.monotonic() + 5
+                while thread.is_alive() and time.monotonic() < deadline:
+                    cur.execute("SELECT wait_event_type FROM pg_stat_activity WHERE pid = %s", (writer_pid,))
+                    if cur.fetchone()[0] == "Lock":
+                        break
+                    time.sleep(0.01)
+            return super().map(*args, **kwargs)
+
+    monkeypatch.setattr(reports_maintenance, "ProcessPoolExecutor", WriteDuringScoring)
+    try:
+        reports_maintenance.close_month(closing_db, "2025-01", str(tmp_path), workers=1)
+        thread.join(5)
+    finally:
+        writer.close()
+
+    assert len(outcome) == 1 and "закрыт" in outcome[0]
+    cur = closing_db.cursor()
+    cur.execute("SELECT facts_json, max_score FROM reports WHERE company_name = 'Альфа'")
+    facts_json, max_score = cur.fetchone()
+    assert json.loads(facts_json) == [10, 12]
+    assert max_score == 4
+    cur.execute("SELECT jsonb_array_length(breakdown) FROM month_results WHERE company_name = 'Альфа'")
+    assert cur.fetchone()[0] == 2
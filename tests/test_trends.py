@@ -0,0 +1,72 @@
+import reports_maintenance
+from trends import fetch_trends
+from visits import apply_visit
+
+VISITS = [
+    ("Альфа", "2025-01", 10, "2025-01-10T09:00:00"),
+    ("Альфа", "2025-01", 12, "2025-01-20T09:00:00"),
+    ("Бета", "2025-01", 7, "2025-01-11T09:00:00"),
+    ("Альфа", "2025-02", 9, "2025-02-10T09:00:00"),
+    ("Альфа", "2025-03", 30, "2025-03-10T09:00:00"),
+    ("Бета", "2025-03", 20, "2025-03-11T09:00:00"),
+]
+MONTHS = ["2025-01", "2025-02", "2025-03"]
+
+
+def _apply(pg, cur):
+    for company_name, month_year, stations, visit_date in VISITS:
+        apply_visit(cur, company_name, month_year, stations, 4, 100, visit_date)
+    pg.commit()
+
+
+def _rows(df):
+    """Строки трендов; NaN (нет предыдущего месяца) — None"""
+    return [tuple(r) for r in df.astype(object).where(df.notna(), None).itertuples(index=False)]
+
+
+# month_year, companies, month_percent, percent_change, percent_avg_3m, score_ratio, score_ratio_change, avg_stations
+# 2025-01: последний отчёт Альфы — 22% (10+12), 0 из 4 баллов; Бета — 7%, 0 из 2
+# 2025-03: Альфа — 30%, 2 из 2 баллов; Бета — 20%, 1 из 2
+EXPECTED = [
+    ("2025-01", 2, 14.5, None, 14.5, 0.0, None, 9.7),
+    ("2025-02", 1, 9.0, -5.5, 11.8, 0.0, 0.0, 9.0),
+    ("2025-03", 2, 25.0, 16.0, 16.2, 0.75, 0.75, 25.0),
+]
+
+
+def test_trends_include_archive(pg):
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    for month_year in MONTHS:
+        reports_maintenance.ensure_partition(cur, month_year)
+    _apply(pg, cur)
+    reports_maintenance.freeze_month(pg, "2025-01")
+    reports_maintenance.archive_month(pg, "2025-01")
+
+    assert _rows(fetch_trends(cur, "2025-01")) == EXPECTED
+
+
+def test_trends_start_month_resets_changes(pg):
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    for month_year in MONTHS:
+        reports_maintenance.ensure_partition(cur, month_year)
+    _apply(pg, cur)
+
+    # Месяцы до start_month в окна не попадают: у первого месяца нет изменения
+    assert _rows(fetch_trends(cur, "2025-02")) == [
+        ("2025-02", 1, 9.0, None, 9.0, 0.0, None, 9.0),
+        ("2025-03", 2, 25.0, 16.0, 17.0, 0.75, 0.75, 25.0),
+    ]
+
+
+def test_trends_before_migration(legacy_reports):
+    """Таблица reports до reports_maintenance.py migrate: reports_archive ещё нет"""
+    cur = legacy_reports.cursor()
+    _apply(legacy_reports, cur)
+
+    assert _rows(fetch_trends(cur, "2025-01")) == EXPECTED
+    assert _rows(fetch_trends(cur, "2025-01", "Бета")) == [
+        ("2025-01", 1, 7.0, None, 7.0, 0.0, None, 7.0),
+        ("2025-03", 1, 20.0, 13.0, 13.5, 0.5, 0.5, 20.0),
+    ]
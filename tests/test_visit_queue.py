@@ -0,0 +1,270 @@
+import time
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+import reports_maintenance
+import visit_queue
+from conftest import TEST_DATABASE_URL
+from visit_queue import VisitQueue
+
+
+class FakeConnection:
+    """Соединение PostgreSQL для очереди: фиксирует выезды только при commit"""
+
+    def __init__(self, db):
+        self.db = db
+        self.pending = []
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        self.db.committed.extend(self.pending)
+        self.pending = []
+        self.db.commits += 1
+
+    def rollback(self):
+        self.pending = []
+        self.db.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.committed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.connections = []
+        self.down = False
+        self.fail_on = None  # выезд (компания, станции), на котором apply_visit падает
+        self.closed = set()
+
+    def connect(self):
+        if self.down:
+            raise ConnectionError("БД недоступна")
+        conn = FakeConnection(self)
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase()
+
+    def apply_visit(cur, company_name, month_year, stations_checked, K, N, visit_date):
+        if db.fail_on == (company_name, stations_checked):
+            raise RuntimeError("ошибка записи")
+        cur.pending.append((company_name, month_year, stations_checked, K, N, visit_date))
+
+    monkeypatch.setattr(visit_queue, "apply_visit", apply_visit)
+    monkeypatch.setattr(visit_queue, "fetch_closed_months", lambda cur: set(db.closed))
+    return db
+
+
+@pytest.fixture
+def flushed():
+    return []
+
+
+@pytest.fixture
+def queue(tmp_path, db, flushed):
+    return VisitQueue(str(tmp_path / "queue.sqlite3"), connect=db.connect, on_flush=flushed.append)
+
+
+def test_put_keeps_visits_until_flushed(queue, db):
+    queue.put("Альфа", "2025-03", 10, 4, 100, "2025-03-01T10:00:00")
+    queue.put("Бета", "2025-03", 5, 4, 50, "2025-03-01T11:00:00")
+    queue.put("Альфа", "2025-03", 12, 4, 100, "2025-03-02T10:00:00")
+
+    assert queue.depth() == 3
+    assert queue.pending_facts("Альфа", "2025-03") == [10, 12]
+    assert queue.pending_facts("Альфа", "2025-04") == []
+    assert db.committed == []
+
+
+def test_flush_applies_in_lock_order_and_empties_queue(queue, db, flushed):
+    queue.put("Бета", "2025-04", 5, 4, 50, "2025-04-01T11:00:00")
+    queue.put("Альфа", "2025-04", 10, 4, 100, "2025-04-01T10:00:00")
+    queue.put("Альфа", "2025-03", 12, 4, 100, "2025-03-02T10:00:00")
+    queue.put("Альфа", "2025-04", 11, 4, 100, "2025-04-02T10:00:00")
+
+    assert queue.flush_once() == 4
+    # По (компания, месяц), внутри компании и месяца — в порядке постановки
+    assert [(v[0], v[1], v[2]) for v in db.committed] == [
+        ("Альфа", "2025-03", 12), ("Альфа", "2025-04", 10), ("Альфа", "2025-04", 11), ("Бета", "2025-04", 5)]
+    assert db.commits == 1
+    assert all(conn.closed for conn in db.connections)
+    assert queue.depth() == 0
+    assert flushed == [{"2025-03", "2025-04"}]
+    assert queue.flush_once() == 0
+
+
+def test_flush_respects_batch_size(queue, db, monkeypatch):
+    monkeypatch.setattr(visit_queue, "QUEUE_BATCH_SIZE", 2)
+    for i in range(5):
+        queue.put("Альфа", "2025-03", i + 1, 4, 100, f"2025-03-0{i + 1}T10:00:00")
+
+    assert [queue.flush_once() for _ in range(4)] == [2, 2, 1, 0]
+    assert [v[2] for v in db.committed] == [1, 2, 3, 4, 5]
+
+
+def test_connection_failure_keeps_queue(queue, db, flushed):
+    queue.put("Альфа", "2025-03", 10, 4, 100, "2025-03-01T10:00:00")
+    db.down = True
+
+    with pytest.raises(ConnectionError):
+        queue.flush_once()
+    assert queue.depth() == 1
+    assert db.committed == []
+    assert flushed == []
+
+
+def test_failed_batch_rolls_back_and_retries(queue, db, flushed):
+    queue.put("Альфа", "2025-03", 10, 4, 100, "2025-03-01T10:00:00")
+    queue.put("Бета", "2025-03", 5, 4, 50, "2025-03-01T11:00:00")
+    db.fail_on = ("Бета", 5)
+
+    with pytest.raises(RuntimeError):
+        queue.flush_once()
+    # Пачка целиком откатилась: первый выезд не записан отдельно от второго
+    assert db.committed == []
+    assert db.rollbacks == 1
+    assert queue.depth() == 2
+    assert flushed == []
+
+    db.fail_on = None
+    assert queue.flush_once() == 2
+    assert [(v[0], v[2]) for v in db.committed] == [("Альфа", 10), ("Бета", 5)]
+    assert queue.depth() == 0
+
+
+def test_background_flusher_retries_until_database_is_back(queue, db):
+    db.down = True
+    queue.put("Альфа", "2025-03", 10, 4, 100, "2025-03-01T10:00:00")
+    queue.start()
+
+    deadline = time.monotonic() + 5
+    while queue.last_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.last_error == "БД недоступна"
+    assert queue.depth() == 1
+
+    db.down = False
+    deadline = time.monotonic() + 10
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert queue.depth() == 0
+    assert [v[2] for v in db.committed] == [10]
+
+
+def test_visits_to_closed_months_are_dead_lettered(queue, db, flushed):
+    queue.put("Альфа", "2025-01", 10, 4, 100, "2025-01-31T23:00:00")
+    queue.put("Бета", "2025-02", 5, 4, 50, "2025-02-01T09:00:00")
+    db.closed = {"2025-01"}
+
+    assert queue.flush_once() == 2
+    # Выезд в закрытый месяц не держит очередь: следующий записан
+    assert [(v[0], v[1]) for v in db.committed] == [("Бета", "2025-02")]
+    assert queue.depth() == 0
+    assert queue.dead_visits() == [("Альфа", "2025-01", 10, "2025-01-31T23:00:00", "месяц 2025-01 закрыт")]
+
+
+CURRENT_MONTH = datetime.now().strftime("%Y-%m")
+
+
+@pytest.fixture
+def pg_connect(pg):
+    """Фабрика соединений с реальным PostgreSQL (схема теста) и партиционированная reports"""
+    cur = pg.cursor()
+    reports_maintenance.create_partitioned_table(cur, "reports")
+    for month_year in ("2025-01", CURRENT_MONTH):
+        reports_maintenance.ensure_partition(cur, month_year)
+    pg.commit()
+    cur.execute("SHOW search_path")
+    (search_path,) = cur.fetchone()
+    cur.close()
+    return lambda: psycopg2.connect(TEST_DATABASE_URL, options=f"-c search_path={search_path}")
+
+
+def test_month_closed_while_visit_queued(pg, pg_connect, tmp_path, monkeypatch):
+    """Реальный PostgreSQL: выезд, поставленный в очередь до закрытия месяца, не блокирует следующие"""
+    current_month = CURRENT_MONTH
+    cur = pg.cursor()
+    queue = VisitQueue(str(tmp_path / "queue.sqlite3"), connect=pg_connect)
+    queue.put("Альфа", "2025-01", 10, 4, 100, "2025-01-31T23:00:00")
+    queue.put("Бета", current_month, 5, 4, 50, current_month + "-01T09:00:00")
+    reports_maintenance.freeze_month(pg, "2025-01")
+
+    # Месяц закрыли между проверкой и записью: пачка откатывается на триггере заморозки
+    monkeypatch.setattr(visit_queue, "fetch_closed_months", lambda cur: set())
+    with pytest.raises(psycopg2.Error, match="закрыт"):
+        queue.flush_once()
+    assert queue.depth() == 2
+
+    monkeypatch.undo()
+    assert queue.flush_once() == 2
+    assert queue.depth() == 0
+    assert [v[:2] for v in queue.dead_visits()] == [("Альфа", "2025-01")]
+    cur.execute("SELECT company_name, month_year FROM reports")
+    assert cur.fetchall() == [("Бета", current_month)]
+
+
+def test_outage_and_restart_lose_nothing(pg, pg_connect, tmp_path, monkeypatch):
+    """Реальный PostgreSQL: БД недоступна при старте, затем соединение обрывается посреди пачки"""
+    monkeypatch.setattr(visit_queue, "QUEUE_BATCH_SIZE", 5)
+    state = {"down": True, "applied": 0, "terminated": False}
+
+    def connect():
+        if state["down"]:
+            # Сервер остановлен: на этом порту никто не слушает
+            return psycopg2.connect(host="localhost", port=1, dbname="postgres", connect_timeout=1)
+        conn = pg_connect()
+        state["pid"] = conn.get_backend_pid()
+        return conn
+
+    apply_visit = visit_queue.apply_visit
+
+    def apply_and_crash(cur, *args):
+        state["applied"] += 1
+        if state["applied"] == 8 and not state["terminated"]:
+            # Перезапуск сервера посреди второй пачки: соединение очереди обрывается
+            state["terminated"] = True
+            admin = pg_connect()
+            admin.cursor().execute("SELECT pg_terminate_backend(%s)", (state["pid"],))
+            admin.commit()
+            admin.close()
+        return apply_visit(cur, *args)
+
+    monkeypatch.setattr(visit_queue, "apply_visit", apply_and_crash)
+    queue = VisitQueue(str(tmp_path / "queue.sqlite3"), connect=connect)
+    expected = {"Альфа": [], "Бета": [], "Гамма": []}
+    for i in range(18):
+        company = ["Альфа", "Бета", "Гамма"][i % 3]
+        visit_date = f"{CURRENT_MONTH}-01T{i:02d}:00:00"
+        queue.put(company, CURRENT_MONTH, i + 1, 4, 100, visit_date)
+        expected[company].append((i + 1, visit_date))
+
+    queue.start()
+    deadline = time.monotonic() + 5
+    while queue.last_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.last_error is not None
+    assert queue.depth() == 18
+    state["down"] = False
+
+    deadline = time.monotonic() + 20
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert state["terminated"]
+    assert queue.depth() == 0
+    cur = pg.cursor()
+    cur.execute("SELECT company_name, facts_json::jsonb, visit_dates FROM reports")
+    stored = {company: list(zip(facts, dates)) for company, facts, dates in cur.fetchall()}
+    # Каждый выезд ровно один раз и в порядке постановки внутри компании
+    assert stored == expected
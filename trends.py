@@ -0,0 +1,62 @@
+import pandas as pd
+
+from journal import table_exists
+
+
+# ---------------------- ТРЕНДЫ ПО МЕСЯЦАМ ---------------------- #
+
+# Последний отчёт каждой компании за месяц (из партиций и, если он уже создан, архива), затем
+# агрегаты по месяцам и оконные функции для динамики. Весь расчёт в БД:
+# в Python приходит по строке на месяц.
+TRENDS_REPORTS_SRC = """
+        SELECT company_name, month_year, created_at, total_score, max_score, month_percent,
+               jsonb_array_length(facts_json::jsonb) AS visits,
+               (SELECT COALESCE(SUM(x::int), 0) FROM jsonb_array_elements_text(facts_json::jsonb) AS x) AS stations
+        FROM reports
+        WHERE month_year >= %(start)s AND (%(company)s::text IS NULL OR company_name = %(company)s)
+"""
+TRENDS_ARCHIVE_SRC = """
+        SELECT company_name, month_year, created_at, total_score, max_score, month_percent,
+               cardinality(facts), (SELECT COALESCE(SUM(x), 0) FROM unnest(facts) AS x)
+        FROM reports_archive
+        WHERE month_year >= %(start)s AND (%(company)s::text IS NULL OR company_name = %(company)s)
+"""
+TRENDS_SQL = """
+    WITH src AS ({src}),
+    monthly AS (
+        SELECT DISTINCT ON (company_name, month_year) *
+        FROM src
+        ORDER BY company_name, month_year, created_at DESC
+    ),
+    per_month AS (
+        SELECT month_year,
+               COUNT(*) AS companies,
+               AVG(month_percent) AS month_percent,
+               SUM(total_score)::float / NULLIF(SUM(max_score), 0) AS score_ratio,
+               SUM(stations)::float / NULLIF(SUM(visits), 0) AS avg_stations
+        FROM monthly
+        GROUP BY month_year
+    )
+    SELECT month_year, companies,
+           ROUND(month_percent::numeric, 1)::float AS month_percent,
+           ROUND((month_percent - LAG(month_percent) OVER w)::numeric, 1)::float AS percent_change,
+           ROUND(AVG(month_percent) OVER (w ROWS BETWEEN 2 PRECEDING AND CURRENT ROW)::numeric, 1)::float AS percent_avg_3m,
+           ROUND(score_ratio::numeric, 3)::float AS score_ratio,
+           ROUND((score_ratio - LAG(score_ratio) OVER w)::numeric, 3)::float AS score_ratio_change,
+           ROUND(avg_stations::numeric, 1)::float AS avg_stations
+    FROM per_month
+    WINDOW w AS (ORDER BY month_year)
+    ORDER BY month_year
+"""
+
+TRENDS_COLUMNS = ["month_year", "companies", "month_percent", "percent_change", "percent_avg_3m",
+                  "score_ratio", "score_ratio_change", "avg_stations"]
+
+
+def fetch_trends(cur, start_month, company_name=None):
+    """Динамика по месяцам начиная с start_month: по компании или по всем (company_name=None)"""
+    src = TRENDS_REPORTS_SRC
+    if table_exists(cur, "reports_archive"):
+        src += "UNION ALL" + TRENDS_ARCHIVE_SRC
+    cur.execute(TRENDS_SQL.format(src=src), {"start": start_month, "company": company_name})
+    return pd.DataFrame(cur.fetchall(), columns=TRENDS_COLUMNS)
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+import time
+
+from db import get_db_connection
+from journal import fetch_closed_months
+from visits import apply_visit
+
+
+# ---------------------- ОЧЕРЕДЬ ВЫЕЗДОВ (write-behind) ---------------------- #
+
+QUEUE_PATH = os.environ.get("VISIT_QUEUE_PATH", "visit_queue.sqlite3")
+QUEUE_BATCH_SIZE = 50
+QUEUE_MAX_BACKOFF = 60  # секунд
+
+
+class VisitQueue:
+    """Локальная очередь выездов в SQLite с фоновой выгрузкой в PostgreSQL.
+
+    Выезды выгружаются пачками в одной транзакции, внутри каждой компании
+    строго в порядке постановки. При ошибке БД пачка откатывается и
+    повторяется с экспоненциальной задержкой.
+    Выезды в уже закрытые месяцы (reports_maintenance.py close) записать
+    нельзя: они переносятся в dead_visits, чтобы не блокировать очередь.
+
+    connect — фабрика соединений с PostgreSQL, on_flush(months) вызывается
+    после каждой выгруженной пачки (сброс кэшей приложения).
+    """
+
+    def __init__(self, path=QUEUE_PATH, connect=get_db_connection, on_flush=None):
+        self.path = path
+        self.connect = connect
+        self.on_flush = on_flush
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_visits (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                company_name TEXT NOT NULL,
+                month_year TEXT NOT NULL,
+                stations_checked INTEGER NOT NULL,
+                planned_visits INTEGER NOT NULL,
+                stations_total INTEGER NOT NULL,
+                visit_date TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_visits (
+                seq INTEGER PRIMARY KEY,
+                company_name TEXT NOT NULL,
+                month_year TEXT NOT NULL,
+                stations_checked INTEGER NOT NULL,
+                planned_visits INTEGER NOT NULL,
+                stations_total INTEGER NOT NULL,
+                visit_date TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def put(self, company_name, month_year, stations_checked, K, N, visit_date):
+        conn = self._connect()
+        with conn:
+            conn.execute("""
+                INSERT INTO pending_visits (company_name, month_year, stations_checked, planned_visits, stations_total, visit_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (company_name, month_year, int(stations_checked), int(K), int(N), visit_date))
+        conn.close()
+        self._wakeup.set()
+
+    def pending_facts(self, company_name, month_year):
+        """Станции по ещё не выгруженным выездам компании (в порядке постановки)"""
+        conn = self._connect()
+        rows = conn.execute("""
+            SELECT stations_checked FROM pending_visits
+            WHERE company_name = ? AND month_year = ? ORDER BY seq
+        """, (company_name, month_year)).fetchall()
+        conn.close()
+        return [r[0] for r in rows]
+
+    def depth(self):
+        conn = self._connect()
+        (count,) = conn.execute("SELECT COUNT(*) FROM pending_visits").fetchone()
+        conn.close()
+        return count
+
+    def dead_visits(self):
+        """Выезды, которые не удалось записать: [(компания, месяц, станции, дата выезда, причина)]"""
+        conn = self._connect()
+        rows = conn.execute("""
+            SELECT company_name, month_year, stations_checked, visit_date, reason
+            FROM dead_visits ORDER BY seq
+        """).fetchall()
+        conn.close()
+        return rows
+
+    def flush_once(self):
+        """Выгрузить одну пачку в PostgreSQL. Возвращает число выгруженных выездов."""
+        conn = self._connect()
+        rows = conn.execute("""
+            SELECT seq, company_name, month_year, stations_checked, planned_visits, stations_total, visit_date
+            FROM pending_visits ORDER BY seq LIMIT ?
+        """, (QUEUE_BATCH_SIZE,)).fetchall()
+        if not rows:
+            conn.close()
+            return 0
+
+        try:
+            pg = self.connect()
+        except Exception:
+            conn.close()
+            raise
+        dead = []
+        try:
+            cur = pg.cursor()
+            # Закрытый месяц заморожен: его выезд падал бы при каждом повторе и держал всю очередь.
+            # Если месяц закроют уже после этой проверки, пачка откатится и при повторе выезд
+            # попадёт сюда
+            closed_months = fetch_closed_months(cur)
+            # Блокировки в порядке (компания, месяц), как требует apply_visit; сортировка
+            # устойчивая, поэтому выезды одной компании остаются в порядке постановки
+            for row in sorted(rows, key=lambda row: (row[1], row[2])):
+                _, company_name, month_year, stations_checked, K, N, visit_date = row
+                if month_year in closed_months:
+                    dead.append(row + (f"месяц {month_year} закрыт",))
+                    continue
+                apply_visit(cur, company_name, month_year, stations_checked, K, N, visit_date)
+            pg.commit()
+            cur.close()
+        except Exception:
+            # Оборванное соединение (перезапуск БД) откатывать нечем: его rollback
+            # заменил бы исходную ошибку на «connection already closed»
+            if not pg.closed:
+                pg.rollback()
+            conn.close()
+            raise
+        finally:
+            pg.close()
+
+        # Удаляем из очереди только после успешного COMMIT
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO dead_visits (seq, company_name, month_year, stations_checked, planned_visits, stations_total, visit_date, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, dead)
+            conn.execute("DELETE FROM pending_visits WHERE seq <= ?", (rows[-1][0],))
+        conn.close()
+        if self.on_flush is not None:
+            self.on_flush({row[2] for row in rows})
+        return len(rows)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                flushed = self.flush_once()
+                self.last_error = None
+                backoff = 1
+            except Exception as e:
+                self.last_error = str(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, QUEUE_MAX_BACKOFF)
+                continue
+            if flushed < QUEUE_BATCH_SIZE:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="visit-queue-flusher", daemon=True)
+            self._thread.start()
@@ -0,0 +1,98 @@
+import json
+
+from scoring import calc_flexible_score_dynamic
+
+
+# ---------------------- ВЫЕЗДЫ И ОТЧЁТЫ МЕСЯЦА ---------------------- #
+# Общая логика записи для приложения, очереди выездов и HTTP API
+
+def add_months(month_year, n):
+    """Сдвинуть месяц "YYYY-MM" на n месяцев (n может быть отрицательным)"""
+    year, month = map(int, month_year.split("-"))
+    year, month = divmod(year * 12 + month - 1 + n, 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+def fetch_month_report(cur, company_name, month_year):
+    """Отчёт компании за месяц или None"""
+    cur.execute("""
+        SELECT id, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits
+        FROM reports 
+        WHERE company_name = %s AND month_year = %s
+        ORDER BY created_at DESC LIMIT 1
+    """, (company_name, month_year))
+    
+    result = cur.fetchone()
+    
+    if result:
+        visit_dates = result[5] if result[5] else []
+        planned_visits = result[6] if result[6] else 4
+        return {
+            'id': result[0],
+            'facts': json.loads(result[1]),
+            'total_score': result[2],
+            'max_score': result[3],
+            'month_percent': result[4],
+            'visit_dates': visit_dates,
+            'planned_visits': planned_visits
+        }
+    return None
+
+
+def apply_visit(cur, company_name, month_year, stations_checked, K, N, visit_date, dedupe=True):
+    """Добавить выезд к месячному отчёту в рамках открытой транзакции.
+
+    При dedupe=True дата выезда служит ключом идемпотентности: выезд с уже
+    записанной датой не добавляется повторно (нужно очереди выездов).
+    Несколько выездов в одной транзакции записываются в порядке
+    (company_name, month_year): блокировки берутся в одном порядке и
+    параллельные пачки (очередь, HTTP API) не блокируют друг друга намертво.
+    Возвращает (results, total_score, max_score, month_percent, число выездов).
+    """
+    # Сериализуем запись по компании и месяцу: иначе два одновременных
+    # первых выезда создадут два отчёта месяца
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{company_name}|{month_year}",))
+    cur.execute("""
+        SELECT id, facts_json, visit_dates
+        FROM reports 
+        WHERE company_name = %s AND month_year = %s
+        ORDER BY created_at DESC LIMIT 1
+        FOR UPDATE
+    """, (company_name, month_year))
+    current = cur.fetchone()
+    
+    if current:
+        facts = json.loads(current[1])
+        visit_dates = current[2] if current[2] else []
+        if dedupe and visit_date in visit_dates:
+            # Выезд уже записан (повтор после сбоя между COMMIT и очисткой очереди)
+            results, total_score, month_percent = calc_flexible_score_dynamic(N, K, facts)
+            return results, total_score, len(facts) * 2, month_percent, len(facts)
+        # Добавляем к существующему
+        facts = facts + [stations_checked]
+        visit_dates = visit_dates + [visit_date]
+    else:
+        # Первый выезд месяца
+        facts = [stations_checked]
+        visit_dates = [visit_date]
+    
+    # Пересчитываем баллы
+    results, total_score, month_percent = calc_flexible_score_dynamic(N, K, facts)
+    max_score = len(facts) * 2
+    
+    if current:
+        # Обновляем существующий отчёт (K не меняем!)
+        cur.execute("""
+            UPDATE reports 
+            SET facts_json = %s, total_score = %s, max_score = %s, 
+                month_percent = %s, visit_dates = %s, created_at = NOW()
+            WHERE id = %s
+        """, (json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent, json.dumps(visit_dates), current[0]))
+    else:
+        # Создаём новый отчёт месяца (сохраняем K!)
+        cur.execute("""
+            INSERT INTO reports (company_name, month_year, facts_json, total_score, max_score, month_percent, visit_dates, planned_visits)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (company_name, month_year, json.dumps(facts, ensure_ascii=False), total_score, max_score, month_percent, json.dumps(visit_dates), K))
+    
+    return results, total_score, max_score, month_percent, len(facts)